@@ -1,69 +1,370 @@
 import os
+import asyncio
 import httpx
-from datetime import datetime
+from datetime import datetime, timedelta
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ratelimit import TokenBucket
+import metrics
 
 load_dotenv()
 
 HELIUS_API_KEY = os.getenv('HELIUS_API_KEY')
-BASE_URL = f"https://api.helius.xyz/v0/addresses/{{address}}/transactions?api-key={HELIUS_API_KEY}"
+HELIUS_BASE_URL = os.getenv('HELIUS_BASE_URL', 'https://api.helius.xyz')
+# Match these to the Helius plan (free tier: 10 req/s)
+HELIUS_MAX_CONCURRENCY = int(os.getenv('HELIUS_MAX_CONCURRENCY', '5'))
+HELIUS_RATE_LIMIT = float(os.getenv('HELIUS_RATE_LIMIT', '10'))
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', str(6 * 3600)))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))
+# Page size and page cap per refresh (bounds the first download of a busy wallet)
+HELIUS_PAGE_SIZE = int(os.getenv('HELIUS_PAGE_SIZE', '100'))
+HELIUS_MAX_PAGES = int(os.getenv('HELIUS_MAX_PAGES', '10'))
 
-async def get_wallet_profile(address: str):
+_helius_latency = metrics.histogram('helius_request_seconds', 'Helius API request latency')
+_helius_errors = metrics.counter('helius_errors_total', 'Failed Helius API requests')
+_cache_hits = metrics.counter('wallet_profile_cache_hits_total', 'Wallet profiles served from memory')
+_db_hits = metrics.counter('wallet_profile_db_hits_total', 'Wallet profiles served from holders_analysis')
+_txs_ingested = metrics.counter('wallet_transactions_ingested_total', 'Helius transactions folded into wallet profiles')
+
+
+class WalletAggregator:
     """
-    Analyzes wallet age, behavior, and basic PNL using Helius API.
+    Single-pass, resumable aggregate over a wallet's transactions.
+    Its state round-trips through the holders_analysis columns, so a refresh
+    only has to feed in transactions newer than last_signature.
+
+    A refresh reads at most HELIUS_MAX_PAGES pages. When that cuts it short,
+    the unread span is remembered as a gap: older than resume_before and newer
+    than resume_until (NULL = back to the wallet's first transaction). Later
+    refreshes close the gap before reading anything newer.
     """
-    if not HELIUS_API_KEY:
-        return {"error": "Helius API Key not found"}
+    MAX_POSITIONS = 1000
 
-    url = BASE_URL.format(address=address)
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            transactions = response.json()
-            
-            if not transactions:
-                return {"style": "New", "age": 0, "volume": 0}
-
-            # 1. Wallet Age
-            last_tx = transactions[-1]
-            first_tx_time = datetime.fromtimestamp(last_tx['timestamp'])
-            age_days = (datetime.utcnow() - first_tx_time).days
-            
-            # 2. Behavior Analysis (Basic)
-            tx_count = len(transactions)
-            buy_count = sum(1 for tx in transactions if 'tokenTransfers' in tx and any(t['toUser'] == address for t in tx['tokenTransfers']))
-            sell_count = sum(1 for tx in transactions if 'tokenTransfers' in tx and any(t['fromUser'] == address for t in tx['tokenTransfers']))
-            
-            style = "Unknown"
-            if tx_count > 50 and sell_count / tx_count > 0.4:
-                style = "Active Trader/Swing"
-            elif tx_count < 10 and age_days > 30:
-                style = "Diamond Hand/Holder"
-            elif tx_count > 100:
-                style = "High Frequency/Bot"
-            else:
-                style = "Regular Trader"
-
-            # 3. PNL / Volume (Simplified)
-            total_sol_in = sum(float(tx['nativeTransfers'][0]['amount']) for tx in transactions if 'nativeTransfers' in tx and tx['nativeTransfers'] and tx['nativeTransfers'][0]['toUser'] == address) / 1e9
-            
-            return {
-                "wallet_address": address,
-                "wallet_age_days": age_days,
-                "total_volume_sol": round(total_sol_in, 2),
-                "trading_style": style,
-                "win_rate": 0.5, # Placeholder for more complex logic
-                "last_updated": datetime.utcnow()
-            }
+    def __init__(self, state=None):
+        state = state or {}
+        self.last_signature = state.get('last_signature')
+        self.resume_before = state.get('resume_before')
+        self.resume_until = state.get('resume_until')
+        self.first_tx_at = state.get('first_tx_at')
+        self.tx_count = state.get('tx_count') or 0
+        self.buy_count = state.get('buy_count') or 0
+        self.sell_count = state.get('sell_count') or 0
+        self.sol_in = int(state.get('sol_in') or 0)
+        self.sol_out = int(state.get('sol_out') or 0)
+        self.positions = {mint: list(pos) for mint, pos in (state.get('positions') or {}).items()}
+
+    def add(self, address, tx):
+        self.tx_count += 1
+        ts = datetime.utcfromtimestamp(tx['timestamp'])
+        if self.first_tx_at is None or ts < self.first_tx_at:
+            self.first_tx_at = ts
+
+        lamports_in = lamports_out = 0
+        for t in tx.get('nativeTransfers') or ():
+            if t.get('toUser') == address:
+                lamports_in += int(t['amount'])
+            elif t.get('fromUser') == address:
+                lamports_out += int(t['amount'])
+        self.sol_in += lamports_in
+        self.sol_out += lamports_out
+
+        bought = sold = False
+        for t in tx.get('tokenTransfers') or ():
+            mint = t.get('mint')
+            if t.get('toUser') == address:
+                bought = True
+                if mint:
+                    self._position(mint)[0] += lamports_out
+            elif t.get('fromUser') == address:
+                sold = True
+                if mint:
+                    self._position(mint)[1] += lamports_in
+        self.buy_count += bought
+        self.sell_count += sold
+
+    def _position(self, mint):
+        pos = self.positions.get(mint)
+        if pos is None:
+            if len(self.positions) >= self.MAX_POSITIONS:
+                # Drop the oldest tracked mint to keep the state bounded
+                del self.positions[next(iter(self.positions))]
+            pos = self.positions[mint] = [0, 0]
+        return pos
+
+    def win_rate(self):
+        closed = [p for p in self.positions.values() if p[1] > 0]
+        if not closed:
+            return 0
+        return round(sum(1 for spent, received in closed if received > spent) / len(closed), 4)
+
+    def style(self, age_days):
+        if self.tx_count == 0:
+            return "New"
+        if self.tx_count > 50 and self.sell_count / self.tx_count > 0.4:
+            return "Active Trader/Swing"
+        if self.tx_count < 10 and age_days > 30:
+            return "Diamond Hand/Holder"
+        if self.tx_count > 100:
+            return "High Frequency/Bot"
+        return "Regular Trader"
+
+    def profile(self, address):
+        """
+        Returns a holders_analysis row (profile plus resumable state).
+        """
+        now = datetime.utcnow()
+        age_days = (now - self.first_tx_at).days if self.first_tx_at else 0
+        return {
+            "wallet_address": address,
+            "wallet_age_days": age_days,
+            "total_volume_sol": round((self.sol_in + self.sol_out) / 1e9, 2),
+            "trading_style": self.style(age_days),
+            "win_rate": self.win_rate(),
+            "last_updated": now,
+            "last_signature": self.last_signature,
+            "resume_before": self.resume_before,
+            "resume_until": self.resume_until,
+            "first_tx_at": self.first_tx_at,
+            "tx_count": self.tx_count,
+            "buy_count": self.buy_count,
+            "sell_count": self.sell_count,
+            "sol_in": self.sol_in,
+            "sol_out": self.sol_out,
+            "positions": self.positions,
+        }
+
+
+class WalletAnalyzer:
+    """
+    Long-lived Helius client: one pooled HTTP/2 connection set, concurrency and
+    rate limits matched to the Helius quota, and a TTL/LRU profile cache that
+    falls back to the holders_analysis table before calling the API.
+    """
+
+    def __init__(self, api_key=HELIUS_API_KEY, base_url=HELIUS_BASE_URL,
+                 max_concurrency=HELIUS_MAX_CONCURRENCY, rate_limit=HELIUS_RATE_LIMIT,
+                 cache_ttl=PROFILE_CACHE_TTL, cache_size=PROFILE_CACHE_SIZE,
+                 session_factory=None):
+        self.api_key = api_key
+        self.cache_ttl = cache_ttl
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=base_url.startswith('https'),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=httpx.Timeout(15.0),
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = TokenBucket(rate_limit, max(1, int(rate_limit)))
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        if session_factory is None:
+            from models import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+
+    async def _get(self, path, params=None):
+        params = dict(params or {}, **{'api-key': self.api_key})
+        async with self.semaphore:
+            await self.bucket.acquire()
+            started = asyncio.get_running_loop().time()
+            try:
+                response = await self.client.get(path, params=params)
+                response.raise_for_status()
+                return response.json()
+            except Exception:
+                _helius_errors.inc()
+                raise
+            finally:
+                _helius_latency.observe(asyncio.get_running_loop().time() - started)
+
+    async def fetch_transactions(self, address, **params):
+        return await self._get(f"/v0/addresses/{address}/transactions", params)
+
+    async def iter_transactions(self, address, until=None, max_pages=HELIUS_MAX_PAGES, before=None):
+        """
+        Streams a wallet's transactions page by page, newest first, from the
+        `before` signature (exclusive) down to the `until` signature (exclusive)
+        or for at most max_pages.
+        """
+        for _ in range(max_pages):
+            params = {"limit": HELIUS_PAGE_SIZE}
+            if before:
+                params["before"] = before
+            if until:
+                params["until"] = until
+            page = await self.fetch_transactions(address, **params)
+            if not page:
+                return
+            yield page
+            if len(page) < HELIUS_PAGE_SIZE:
+                return
+            before = page[-1]['signature']
+
+    def _load_stored(self, addresses):
+        """
+        Returns {address: (row dict, is_fresh)} for wallets already in holders_analysis.
+        """
+        from models import HolderAnalysis
 
+        fresh_after = datetime.utcnow() - timedelta(seconds=self.cache_ttl)
+        columns = [c.name for c in HolderAnalysis.__table__.columns]
+        with self.session_factory() as db:
+            rows = db.query(HolderAnalysis).filter(HolderAnalysis.wallet_address.in_(addresses)).all()
+            stored = {}
+            for r in rows:
+                row = {c: getattr(r, c) for c in columns}
+                for c in ('total_volume_sol', 'win_rate'):
+                    row[c] = float(row[c] or 0)
+                stored[r.wallet_address] = (row, r.last_updated is not None and r.last_updated >= fresh_after)
+            return stored
+
+    def _store(self, profiles):
+        from models import HolderAnalysis
+
+        stmt = pg_insert(HolderAnalysis.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['wallet_address'],
+            set_={c: stmt.excluded[c] for c in profiles[0] if c != 'wallet_address'},
+        )
+        with self.session_factory() as db:
+            db.execute(stmt, profiles)
+            db.commit()
+
+    async def _read_span(self, address, agg, before, until, max_pages):
+        """
+        Folds the transactions between before and until into agg.
+        Returns (newest signature, oldest signature, pages read, reached until).
+        """
+        newest = oldest = None
+        pages, complete = 0, True
+        async for page in self.iter_transactions(address, until=until, max_pages=max_pages, before=before):
+            pages += 1
+            if newest is None:
+                newest = page[0]['signature']
+            oldest = page[-1]['signature']
+            for tx in page:
+                agg.add(address, tx)
+            _txs_ingested.inc(len(page))
+            # A full last page means the cap, not the end, stopped the read
+            complete = len(page) < HELIUS_PAGE_SIZE
+        if pages == 0:
+            complete = True
+        return newest, oldest, pages, complete
+
+    async def _profile_from_api(self, address, state=None):
+        """
+        Folds transactions not yet read into the stored aggregate: first any gap
+        left by an earlier capped refresh, then everything newer than the cursor.
+        """
+        if not self.api_key:
+            return {"error": "Helius API Key not found"}
+        agg = WalletAggregator(state)
+        budget = HELIUS_MAX_PAGES
+        try:
+            if agg.resume_before:
+                _, oldest, pages, complete = await self._read_span(
+                    address, agg, agg.resume_before, agg.resume_until, budget)
+                budget -= pages
+                if complete:
+                    agg.resume_before = agg.resume_until = None
+                elif oldest:
+                    agg.resume_before = oldest
+            # Only one gap is tracked, so newer transactions wait until it is closed
+            if budget > 0 and not agg.resume_before:
+                newest, oldest, pages, complete = await self._read_span(
+                    address, agg, None, agg.last_signature, budget)
+                if not complete:
+                    agg.resume_before, agg.resume_until = oldest, agg.last_signature
+                if newest:
+                    agg.last_signature = newest
         except Exception as e:
             print(f"Error fetching Helius data for {address}: {e}")
             return None
+        return agg.profile(address)
+
+    async def get_wallet_profile(self, address):
+        """
+        Analyzes wallet age, behavior, and basic PNL, using cached results when fresh.
+        """
+        profiles = await self.profile_many([address])
+        return profiles.get(address)
+
+    async def profile_many(self, addresses, persist=True):
+        """
+        Profiles many wallets concurrently (bounded by the semaphore and rate limit).
+        Returns {address: profile}; wallets that failed map to None.
+        """
+        wanted = list(dict.fromkeys(addresses))
+        result = {}
+        missing = []
+        for address in wanted:
+            profile = self.cache.get(address)
+            if profile is not None:
+                _cache_hits.inc()
+                result[address] = profile
+            else:
+                missing.append(address)
+
+        stale = {}
+        if missing:
+            try:
+                stored = await asyncio.to_thread(self._load_stored, missing)
+            except Exception as e:
+                print(f"Error reading stored wallet profiles: {e}")
+                stored = {}
+            for address, (profile, fresh) in stored.items():
+                if fresh:
+                    _db_hits.inc()
+                    self.cache[address] = profile
+                    result[address] = profile
+                else:
+                    stale[address] = profile
+            missing = [a for a in missing if a not in result]
+
+        # Stale wallets resume from their stored cursor instead of re-downloading history
+        fetched = await asyncio.gather(*(self._profile_from_api(a, stale.get(a)) for a in missing))
+        to_store = []
+        for address, profile in zip(missing, fetched):
+            result[address] = profile
+            if profile and 'wallet_address' in profile:
+                self.cache[address] = profile
+                to_store.append(profile)
+
+        if persist and to_store:
+            try:
+                await asyncio.to_thread(self._store, to_store)
+            except Exception as e:
+                print(f"Error saving wallet profiles: {e}")
+        return result
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_default_analyzer = None
+
+
+def get_analyzer():
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = WalletAnalyzer()
+    return _default_analyzer
+
+
+async def get_wallet_profile(address: str):
+    """
+    Analyzes wallet age, behavior, and basic PNL using Helius API.
+    """
+    return await get_analyzer().get_wallet_profile(address)
 
 if __name__ == "__main__":
-    import asyncio
-    # Test with a known whale or user address
-    # asyncio.run(get_wallet_profile("..."))
-    pass
+    import sys
+    # Profile wallets given on the command line (set HELIUS_BASE_URL to hit a local stub)
+    async def _main(addresses):
+        analyzer = WalletAnalyzer()
+        try:
+            for address, profile in (await analyzer.profile_many(addresses, persist=False)).items():
+                print(address, profile)
+        finally:
+            await analyzer.close()
+    asyncio.run(_main(sys.argv[1:]))
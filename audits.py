@@ -0,0 +1,32 @@
+import zlib
+
+# Rick Bot audits are a few hundred bytes: too short for plain deflate (or
+# Postgres TOAST, which only compresses values over ~2KB) to find much to reuse.
+# Priming deflate with the fixed parts of the response roughly halves them.
+# Stored blobs start with a format byte; never edit a dictionary in place,
+# add a new format instead.
+_DICTIONARIES = {
+    1: (
+        "🌐 Solana @ Raydium\n💰 USD: $0.0\n💎 FDV: $\n💦 Liq: $K [x\n📊 Vol: $M Age: h\n"
+        "📈 1H: % ⋅ $K 🅑  Ⓢ \n👥 TH: ⋅⋅⋅⋅ [%]\n\n💊  Coin [K/%] $"
+    ).encode(),
+}
+FORMAT = 1
+COMPRESSION_LEVEL = 9
+
+
+def pack(text):
+    """
+    Compresses an audit for token_audits.raw.
+    """
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15, zdict=_DICTIONARIES[FORMAT])
+    return bytes([FORMAT]) + compressor.compress(text.encode()) + compressor.flush()
+
+
+def unpack(blob):
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    fmt, body = blob[0], blob[1:]
+    decompressor = zlib.decompressobj(-15, zdict=_DICTIONARIES[fmt])
+    return (decompressor.decompress(body) + decompressor.flush()).decode()
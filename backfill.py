@@ -0,0 +1,331 @@
+"""
+Historical backfill and replay.
+
+    python backfill.py channel <@username|-100id> [--days 30] [--limit N] [--restart]
+    python backfill.py replay [--channel PEER_ID] [--since 2024-01-01] [--until 2024-02-01]
+                              [--rick-peer-id ID] [--restart]
+
+`channel` streams a channel's history from Telegram (oldest first) into
+messages and token_mentions. `replay` runs stored messages through the current
+parser and scorer again and rebuilds their token_mentions.
+
+Both go through pipeline.Pipeline in replay mode: message timestamps drive the
+velocity counter and duplicate detection, and no Rick Bot audits are sent.
+Rows are written with COPY in one transaction per chunk together with the
+run's backfill_cursors row, so an interrupted run resumes after its last
+chunk. Token rows are upserted and rescored once per chunk; their velocity
+columns are left to the live rescoring pass.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, insert, tuple_, and_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import (AsyncSessionLocal, async_engine, Message, TokenMention, TokenMentionRollup, BackfillCursor,
+                    TargetChannel, init_db)
+from migrations import ensure_partitions_between, RETENTION_DAYS
+from pipeline import Pipeline
+from repository import upsert_and_score, mention_rows, append_audits, token_ids
+from velocity import MentionCounter
+import metrics
+
+load_dotenv()
+
+API_ID = os.getenv('TELEGRAM_API_ID')
+API_HASH = os.getenv('TELEGRAM_API_HASH')
+PHONE = os.getenv('TELEGRAM_PHONE')
+# Separate session file so a backfill can run next to the worker
+BACKFILL_SESSION = os.getenv('BACKFILL_SESSION', 'backfill_session')
+
+# Messages per transaction
+BACKFILL_CHUNK = int(os.getenv('BACKFILL_CHUNK', '20000'))
+# Counts as of a past moment; rescoring.py recomputes the current ones from token_mentions
+VELOCITY_FIELDS = ('mentions_5m', 'mentions_15m', 'mentions_1h')
+
+_replayed = metrics.counter('backfill_messages_total', 'Messages run through a backfill or replay')
+_chunk_latency = metrics.histogram('backfill_chunk_seconds', 'Time to write one backfill chunk',
+                                   buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+class BulkWriter:
+    """
+    Stand-in for persistence.WriteBehindWriter in replays: rows are buffered in
+    memory and written by flush(), messages and mentions with COPY and tokens
+    as one merged upsert_and_score.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, store_messages=True):
+        self.session_factory = session_factory
+        # Replays of stored messages must not insert them again
+        self.store_messages = store_messages
+        self.on_scored = None
+        self.failed_flushes = 0
+        self.messages, self.mentions, self.audits, self.tokens = [], [], [], {}
+        self._partition_days = set()
+
+    async def add_message(self, channel_id, sender_id, text, timestamp=None):
+        if self.store_messages:
+            self.messages.append({"channel_id": channel_id, "sender_id": sender_id, "text": text,
+                                  "timestamp": timestamp or datetime.utcnow()})
+
+    async def add_mention(self, ca, channel_id, timestamp=None):
+        self.mentions.append({"contract_address": ca, "channel_id": channel_id,
+                              "timestamp": timestamp or datetime.utcnow()})
+
+    async def add_audit(self, ca, text, timestamp=None):
+        # Audits of stored Rick replies are already in token_audits
+        if self.store_messages:
+            self.audits.append({"contract_address": ca, "text": text, "created_at": timestamp or datetime.utcnow()})
+
+    async def update_token(self, ca, fields, audit=False):
+        row = self.tokens.setdefault(ca, {"contract_address": ca})
+        row.update((k, v) for k, v in fields.items() if k not in VELOCITY_FIELDS)
+
+    async def flush(self, cursor, replace_mentions=None, replace_rollups=None):
+        """
+        Writes the buffered rows and `cursor` (a backfill_cursors row) in one transaction.
+        replace_mentions and replace_rollups are WHERE clauses on token_mentions and
+        token_mention_rollups for the rows this chunk rebuilds.
+        """
+        started = time.perf_counter()
+        ids = {}
+        async with self.session_factory() as db:
+            conn = await db.connection()
+            postgres = conn.dialect.name == 'postgresql'
+            if postgres:
+                await self._ensure_partitions()
+            # First statement, so the transaction is open before COPY runs on the raw connection
+            stmt = pg_insert(BackfillCursor.__table__).values(cursor)
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=['source', 'channel'],
+                set_={c: stmt.excluded[c] for c in cursor if c not in ('source', 'channel')},
+            ))
+            if replace_mentions is not None:
+                await db.execute(delete(TokenMention.__table__).where(replace_mentions))
+            if replace_rollups is not None:
+                await db.execute(delete(TokenMentionRollup.__table__).where(replace_rollups))
+            await _copy(conn, Message.__table__, self.messages, postgres)
+            if self.tokens:
+                await upsert_and_score(db, list(self.tokens.values()), ids)
+            if self.mentions:
+                await _copy(conn, TokenMention.__table__, await mention_rows(db, self.mentions, ids), postgres)
+            if self.audits:
+                await append_audits(db, self.audits, ids)
+            await db.commit()
+        token_ids.update(ids)
+        self.messages, self.mentions, self.audits, self.tokens = [], [], [], {}
+        _chunk_latency.observe(time.perf_counter() - started)
+
+    async def _ensure_partitions(self):
+        days = {r['timestamp'].date() for r in (*self.messages, *self.mentions)} - self._partition_days
+        if days:
+            await asyncio.to_thread(ensure_partitions_between, min(days), max(days))
+            self._partition_days.update(days)
+
+
+async def _copy(conn, table, rows, postgres):
+    if not rows:
+        return
+    if not postgres:
+        await conn.execute(insert(table), rows)
+        return
+    columns = list(rows[0])
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        table.name, schema_name=table.schema, columns=columns,
+        records=[tuple(r[c] for c in columns) for r in rows],
+    )
+
+
+async def load_cursor(source, channel, restart=False, session_factory=AsyncSessionLocal):
+    async with session_factory() as db:
+        if restart:
+            await db.execute(delete(BackfillCursor.__table__).where(
+                BackfillCursor.source == source, BackfillCursor.channel == channel))
+            await db.commit()
+            return None
+        return await db.get(BackfillCursor, (source, channel))
+
+
+async def live_boundary(peer_id, after=None, session_factory=AsyncSessionLocal):
+    """
+    Where a channel backfill must stop: the first message of the channel stored
+    after `after` (by the live worker, or an earlier backfill), or when the
+    worker resolved the channel, whichever comes first. messages has no
+    Telegram message id to deduplicate on, so nothing past it may be fetched.
+    """
+    stored = select(func.min(Message.timestamp)).where(Message.channel_id == peer_id)
+    if after is not None:
+        stored = stored.where(Message.timestamp > after)
+    async with session_factory() as db:
+        first = (await db.execute(stored)).scalar()
+        resolved = (await db.execute(select(func.min(TargetChannel.resolved_at))
+                                     .where(TargetChannel.peer_id == peer_id))).scalar()
+    bounds = [t for t in (first, resolved) if t is not None]
+    return min(bounds) if bounds else None
+
+
+def _cursor_row(source, channel, message_id, timestamp, done):
+    return {"source": source, "channel": channel, "last_message_id": message_id,
+            "last_timestamp": timestamp, "messages_done": done, "updated_at": datetime.utcnow()}
+
+
+def _progress(label, done, timestamp, started, count):
+    rate = count / max(time.perf_counter() - started, 1e-9)
+    print(f"{label}: {done} messages (up to {timestamp:%Y-%m-%d %H:%M}), {rate:,.0f} msg/s")
+
+
+async def backfill_channel(client, identifier, days=RETENTION_DAYS['messages'], limit=None, restart=False,
+                           chunk=BACKFILL_CHUNK):
+    """
+    Streams a channel's history from Telegram, oldest first, resuming after the
+    last message of the previous run. Only the last `days` are fetched (0 = all),
+    and it stops before anything already stored (see live_boundary).
+    Returns the number of messages read.
+    """
+    from telethon import utils
+
+    entity = await client.get_entity(int(identifier) if identifier.lstrip('-').isdigit() else identifier)
+    peer_id = utils.get_peer_id(entity)
+    channel = str(peer_id)
+    cursor = await load_cursor('telegram', channel, restart)
+    done = cursor.messages_done if cursor else 0
+
+    writer = BulkWriter()
+    pipeline = Pipeline(writer, dispatch=None, counter=MentionCounter(), replay=True)
+    since = datetime.now(timezone.utc) - timedelta(days=days) if days else None
+    until = await live_boundary(peer_id, cursor.last_timestamp if cursor else None)
+    if until is not None:
+        print(f"Backfilling {channel} up to {until:%Y-%m-%d %H:%M} (already stored from there on)")
+
+    started, count, pending, last = time.perf_counter(), 0, 0, None
+    async for message in client.iter_messages(entity, reverse=True, min_id=cursor.last_message_id if cursor else 0,
+                                              offset_date=since, limit=limit):
+        timestamp = message.date.replace(tzinfo=None)
+        if until is not None and timestamp >= until:
+            break
+        last, pending = message, pending + 1
+        if message.message:
+            await pipeline.handle_message(peer_id, message.sender_id, message.message, timestamp=timestamp)
+        if pending >= chunk:
+            done, count, pending = done + pending, count + pending, 0
+            await writer.flush(_cursor_row('telegram', channel, last.id, last.date.replace(tzinfo=None), done))
+            _replayed.inc(chunk)
+            _progress(f"Backfilled {channel}", done, last.date, started, count)
+    if pending:
+        done, count = done + pending, count + pending
+        await writer.flush(_cursor_row('telegram', channel, last.id, last.date.replace(tzinfo=None), done))
+        _replayed.inc(pending)
+        _progress(f"Backfilled {channel}", done, last.date, started, count)
+    return count
+
+
+async def replay_stored(channel=None, since=None, until=None, rick_peer_id=None, restart=False,
+                        chunk=BACKFILL_CHUNK, session_factory=AsyncSessionLocal):
+    """
+    Replays stored messages in (timestamp, id) order through the current pipeline,
+    one keyset page per chunk, replacing the token_mentions of the replayed span.
+    Compacted mentions in the span are replaced too, at bucket granularity: a
+    rollup bucket belongs to the page its bucket_start falls in.
+    Returns the number of messages replayed.
+    """
+    key = channel or '*'
+    cursor = await load_cursor('replay', key, restart, session_factory)
+    done = cursor.messages_done if cursor else 0
+    after = (cursor.last_timestamp, cursor.last_message_id) if cursor else None
+
+    writer = BulkWriter(session_factory, store_messages=False)
+    pipeline = Pipeline(writer, dispatch=None, counter=MentionCounter(), replay=True)
+    rick_chat = int(rick_peer_id) if rick_peer_id else None
+    table, mentions, rollups = Message.__table__, TokenMention.__table__, TokenMentionRollup.__table__
+
+    query = select(table.c.id, table.c.channel_id, table.c.sender_id, table.c.text, table.c.timestamp)
+    if channel:
+        query = query.where(table.c.channel_id == int(channel))
+    if since:
+        query = query.where(table.c.timestamp >= since)
+    if until:
+        query = query.where(table.c.timestamp < until)
+    query = query.order_by(table.c.timestamp, table.c.id).limit(chunk)
+
+    started, count = time.perf_counter(), 0
+    while True:
+        page = query if after is None else query.where(tuple_(table.c.timestamp, table.c.id) > after)
+        async with session_factory() as db:
+            rows = (await db.execute(page)).all()
+        if not rows:
+            break
+        for r in rows:
+            if r.text:
+                await pipeline.handle_message(r.channel_id, r.sender_id, r.text, r.channel_id == rick_chat,
+                                              timestamp=r.timestamp)
+
+        # This page rebuilds the mentions of (previous page, its last timestamp]
+        lower = mentions.c.timestamp > after[0] if after else mentions.c.timestamp >= rows[0].timestamp
+        replace = and_(lower, mentions.c.timestamp <= rows[-1].timestamp)
+        lower = rollups.c.bucket_start > after[0] if after else rollups.c.bucket_start >= rows[0].timestamp
+        replace_rollups = and_(lower, rollups.c.bucket_start <= rows[-1].timestamp)
+        if channel:
+            replace = and_(replace, mentions.c.channel_id == int(channel))
+            replace_rollups = and_(replace_rollups, rollups.c.channel_id == int(channel))
+
+        done, count = done + len(rows), count + len(rows)
+        await writer.flush(_cursor_row('replay', key, rows[-1].id, rows[-1].timestamp, done), replace, replace_rollups)
+        _replayed.inc(len(rows))
+        _progress(f"Replayed {key}", done, rows[-1].timestamp, started, count)
+        after = (rows[-1].timestamp, rows[-1].id)
+    return count
+
+
+def _date(value):
+    return datetime.fromisoformat(value)
+
+
+async def main(argv=None):
+    ap = argparse.ArgumentParser(description="Backfill channel history or replay stored messages.")
+    sub = ap.add_subparsers(dest='command', required=True)
+    ch = sub.add_parser('channel', help='fetch a channel history from Telegram')
+    ch.add_argument('identifier', help='@username or -100 channel id')
+    ch.add_argument('--days', type=int, default=RETENTION_DAYS['messages'],
+                    help='how far back to go (default: the messages retention; 0 = everything)')
+    ch.add_argument('--limit', type=int, default=None)
+    ch.add_argument('--restart', action='store_true', help='ignore the saved cursor')
+    rp = sub.add_parser('replay', help='re-run stored messages through the pipeline')
+    rp.add_argument('--channel', default=None, help='peer id as stored in messages.channel_id')
+    rp.add_argument('--since', type=_date, default=None)
+    rp.add_argument('--until', type=_date, default=None)
+    rp.add_argument('--rick-peer-id', type=int, default=None, help="Rick Bot's peer id, to replay its audits")
+    rp.add_argument('--restart', action='store_true', help='ignore the saved cursor')
+    for p in (ch, rp):
+        p.add_argument('--chunk', type=int, default=BACKFILL_CHUNK, help='messages per transaction')
+    args = ap.parse_args(argv)
+
+    init_db()
+    try:
+        if args.command == 'channel':
+            from telethon import TelegramClient
+
+            client = TelegramClient(BACKFILL_SESSION, API_ID, API_HASH)
+            await client.start(phone=PHONE)
+            try:
+                count = await backfill_channel(client, args.identifier, args.days, args.limit, args.restart, args.chunk)
+            finally:
+                await client.disconnect()
+        else:
+            count = await replay_stored(args.channel, args.since, args.until, args.rick_peer_id, args.restart,
+                                        args.chunk)
+        print(f"Done: {count} messages.")
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nInterrupted; the next run resumes after the last saved chunk.")
+        sys.exit(130)
@@ -0,0 +1,120 @@
+"""
+Replay benchmark and resume check for backfill.py.
+
+    python benchmarks/backfill_bench.py [--messages 200000] [--chunk 20000] [--database-url postgresql://...]
+
+Seeds bot_schema.messages with synthetic channel traffic (the pipeline_bench.py
+mix, one message per second), then:
+  1. replays everything and reports messages/sec and the token_mentions rebuilt;
+  2. replays again from scratch, failing the third chunk's write, resumes, and
+     checks the resumed run ends with exactly the same token_mentions.
+Without --database-url the tables live in a throwaway SQLite file (plain
+INSERTs instead of COPY); with it, migrations are applied to that (ephemeral!)
+Postgres database first.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pipeline_bench import DEFAULT_MIX, parse_mix, fake_events, setup_database
+
+
+def seed(n, seed_value):
+    from sqlalchemy import insert
+    import models
+
+    start = datetime.utcnow() - timedelta(seconds=n)
+    rows = [
+        {"channel_id": ev.chat_id, "sender_id": ev.sender_id, "text": ev.message.message,
+         "timestamp": start + timedelta(seconds=i)}
+        for i, (kind, ev) in enumerate(fake_events(n, parse_mix(DEFAULT_MIX), seed_value)) if kind != 'rick'
+    ]
+    with models.engine.begin() as conn:
+        for i in range(0, len(rows), 10000):
+            conn.execute(insert(models.Message.__table__), rows[i:i + 10000])
+    return len(rows)
+
+
+async def mention_snapshot():
+    from sqlalchemy import select
+    import models
+
+    m = models.TokenMention.__table__
+    async with models.AsyncSessionLocal() as db:
+        rows = (await db.execute(select(m.c.token_id, m.c.channel_id, m.c.timestamp))).all()
+    return sorted(tuple(r) for r in rows)
+
+
+async def run(chunk):
+    import models
+    import backfill
+
+    started = time.perf_counter()
+    replayed = await backfill.replay_stored(restart=True, chunk=chunk)
+    elapsed = time.perf_counter() - started
+    expected = await mention_snapshot()
+
+    # Interrupt a fresh replay on its third chunk, then resume it
+    flush, calls = backfill.BulkWriter.flush, [0]
+
+    async def failing_flush(self, *args, **kwargs):
+        calls[0] += 1
+        if calls[0] == 3:
+            raise RuntimeError("simulated crash")
+        return await flush(self, *args, **kwargs)
+
+    backfill.BulkWriter.flush = failing_flush
+    try:
+        await backfill.replay_stored(restart=True, chunk=chunk)
+    except RuntimeError:
+        pass
+    finally:
+        backfill.BulkWriter.flush = flush
+    resumed = await backfill.replay_stored(chunk=chunk)
+    actual = await mention_snapshot()
+    await models.async_engine.dispose()
+
+    return {
+        "replayed": replayed,
+        "replay_msgs_per_sec": round(replayed / elapsed, 1),
+        "token_mentions": len(expected),
+        "resumed_after_crash": resumed,
+        "resume_matches": actual == expected,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--messages', type=int, default=200000)
+    ap.add_argument('--chunk', type=int, default=20000)
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--database-url', default=None,
+                    help='Postgres URL of a throwaway database (default: temporary SQLite)')
+    args = ap.parse_args()
+
+    cleanup = setup_database(args.database_url)
+    try:
+        seeded = seed(args.messages, args.seed)
+        # Keep per-message prints from dominating the measurement
+        sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+        try:
+            results = asyncio.run(run(args.chunk))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    finally:
+        cleanup()
+
+    print(json.dumps(dict(results, seeded=seeded), indent=2))
+    return 0 if results['resume_matches'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Local stand-in for the Helius enhanced-transactions API.
+
+    python benchmarks/helius_stub.py --port 8899
+    HELIUS_BASE_URL=http://127.0.0.1:8899 HELIUS_API_KEY=stub python analysis.py <wallet> ...
+
+Serves GET /v0/addresses/<address>/transactions from fixtures/helius_transactions.json
+(newest first, honouring `before`, `until` and `limit`). Unknown wallets get an empty history.
+Also importable: `start_stub()` runs it on a background thread and returns (server, base_url).
+"""
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'helius_transactions.json')
+_PATH = re.compile(r'^/v0/addresses/([^/]+)/transactions$')
+
+
+def load_wallets(path=FIXTURE):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def make_handler(wallets, latency=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        requests_served = 0
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            m = _PATH.match(url.path)
+            if not m:
+                self.send_error(404)
+                return
+            qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+            txs = wallets.get(m.group(1), [])
+            sigs = [tx['signature'] for tx in txs]
+            start = sigs.index(qs['before']) + 1 if qs.get('before') in sigs else 0
+            end = sigs.index(qs['until']) if qs.get('until') in sigs else len(txs)
+            limit = int(qs.get('limit', 100))
+            page = txs[start:end][:limit]
+
+            if latency:
+                time.sleep(latency)
+            Handler.requests_served += 1
+            body = json.dumps(page).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_stub(port=0, wallets=None, latency=0.0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(wallets or load_wallets(), latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--port', type=int, default=8899)
+    ap.add_argument('--latency', type=float, default=0.0, help='seconds added to each response')
+    args = ap.parse_args()
+    server, url = start_stub(args.port, latency=args.latency)
+    print(f"Helius stub listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
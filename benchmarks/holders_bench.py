@@ -0,0 +1,117 @@
+"""
+Holder profiling benchmark against the local Helius stub.
+
+    python benchmarks/holders_bench.py [--tokens 200] [--holders 10] [--wallets 500] [--latency 0.02]
+
+First checks the recorded Rick Bot audit in fixtures/rick_holders.json: its
+holder wallets are extracted from the link entities, profiled through the stub
+and the token ends up with the expected smart_money_ratio. Then audits of
+--tokens synthetic tokens, each with --holders wallets drawn from a pool of
+--wallets, are pushed through holders.HolderProfiler. Reports wallets profiled,
+Helius requests, batches and audits/sec. The tables live in a throwaway SQLite
+file as in pipeline_bench.py.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pipeline_bench import random_solana_address, setup_database
+from helius_stub import start_stub, load_wallets
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'rick_holders.json')
+
+
+async def run(fixture, tokens, holders_per_token, pool_size, seed):
+    from sqlalchemy import select, func
+    import models
+    from analysis import WalletAnalyzer
+    from parser import extract_holder_wallets
+    from persistence import WriteBehindWriter
+    from holders import HolderProfiler
+
+    writer = WriteBehindWriter()
+    writer.start()
+    analyzer = WalletAnalyzer()
+    profiler = HolderProfiler(analyzer, writer)
+    profiler.start()
+
+    failures = 0
+    holders = extract_holder_wallets(fixture['text'], fixture['links'], exclude=(fixture['ca'],))
+    if [list(h) for h in holders] != fixture['expect_holders']:
+        failures += 1
+        print(f"MISMATCH holders\n  expected {fixture['expect_holders']}\n  got      {holders}")
+    profiler.submit(fixture['ca'], holders)
+
+    rng = random.Random(seed)
+    pool = list(load_wallets()) + [random_solana_address(rng) for _ in range(pool_size)]
+    audits = [(random_solana_address(rng), [(w, round(rng.uniform(0.5, 5), 1)) for w in rng.sample(pool, holders_per_token)])
+              for _ in range(tokens)]
+
+    started = time.perf_counter()
+    for ca, token_holders in audits:
+        profiler.submit(ca, token_holders)
+    await profiler.drain()
+    await writer.drain()
+    elapsed = time.perf_counter() - started
+
+    async with models.AsyncSessionLocal() as db:
+        ratio = await db.scalar(select(models.Token.smart_money_ratio)
+                                .where(models.Token.contract_address == fixture['ca']))
+        scored = await db.scalar(select(func.count()).select_from(models.Token)
+                                 .where(models.Token.smart_money_ratio.isnot(None)))
+        stored_holders = await db.scalar(select(func.count()).select_from(models.TokenHolder))
+        profiles = await db.scalar(select(func.count()).select_from(models.HolderAnalysis))
+    if ratio is None or round(float(ratio), 4) != fixture['expect_smart_money_ratio']:
+        failures += 1
+        print(f"MISMATCH smart_money_ratio: expected {fixture['expect_smart_money_ratio']}, got {ratio}")
+
+    await profiler.close()
+    await analyzer.close()
+    await writer.close()
+    await models.async_engine.dispose()
+    return failures, {
+        "audits": tokens + 1,
+        "tokens_scored": scored,
+        "token_holders": stored_holders,
+        "wallets_profiled": profiles,
+        "audits_per_sec": round(tokens / elapsed, 1),
+        "write_flush_errors": writer.failed_flushes,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--tokens', type=int, default=200)
+    ap.add_argument('--holders', type=int, default=10)
+    ap.add_argument('--wallets', type=int, default=500)
+    ap.add_argument('--latency', type=float, default=0.02, help='seconds added to each stub response')
+    ap.add_argument('--seed', type=int, default=42)
+    args = ap.parse_args()
+
+    with open(FIXTURE, encoding='utf-8') as f:
+        fixture = json.load(f)
+
+    server, url = start_stub(latency=args.latency)
+    os.environ.update(HELIUS_BASE_URL=url, HELIUS_API_KEY='stub', HOLDER_BATCH_INTERVAL='0.2')
+    cleanup = setup_database(None)
+    try:
+        failures, results = asyncio.run(run(fixture, args.tokens, args.holders, args.wallets, args.seed))
+    finally:
+        cleanup()
+        server.shutdown()
+
+    results["helius_requests"] = server.RequestHandlerClass.requests_served
+    print(json.dumps(results, indent=2))
+    print(f"{failures} fixture mismatches")
+    return 1 if failures or results['write_flush_errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
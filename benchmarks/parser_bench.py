@@ -0,0 +1,88 @@
+"""
+Parser benchmark over the fixture corpus.
+
+    python benchmarks/parser_bench.py [--rounds 2000]
+
+Checks every fixture's expected output first, then reports messages/sec and
+the transient memory allocated per message (tracemalloc peak).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import extract_cas, parse_rick_bot_response
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'parser_corpus.json')
+
+
+def parse(item):
+    if item['kind'] == 'rick':
+        return parse_rick_bot_response(item['text'])
+    return extract_cas(item['text'])
+
+
+def check(corpus):
+    failures = 0
+    for item in corpus:
+        got = parse(item)
+        if item['kind'] == 'rick':
+            got = {k: got.get(k) for k in item['expect']}
+        else:
+            got = [list(pair) for pair in got]
+        if got != item['expect']:
+            failures += 1
+            print(f"MISMATCH: {item['text'][:60]!r}\n  expected {item['expect']}\n  got      {got}")
+    return failures
+
+
+def bench(corpus, rounds):
+    texts = [(item['kind'], item['text']) for item in corpus]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for kind, text in texts:
+            if kind == 'rick':
+                parse_rick_bot_response(text)
+            else:
+                extract_cas(text)
+    elapsed = time.perf_counter() - started
+    return rounds * len(texts) / elapsed
+
+
+def alloc_per_message(corpus):
+    tracemalloc.start()
+    total = 0
+    for item in corpus:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        parse(item)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - base
+    tracemalloc.stop()
+    return total / len(corpus)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rounds', type=int, default=2000)
+    args = ap.parse_args()
+
+    with open(CORPUS, encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    failures = check(corpus)
+    rate = bench(corpus, args.rounds)
+    alloc = alloc_per_message(corpus)
+
+    print(f"corpus:        {len(corpus)} messages ({failures} mismatches)")
+    print(f"throughput:    {rate:,.0f} messages/sec")
+    print(f"alloc/message: {alloc:,.0f} bytes (tracemalloc peak)")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
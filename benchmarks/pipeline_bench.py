@@ -0,0 +1,270 @@
+"""
+End-to-end benchmark of the worker's message handler without Telegram.
+
+    python benchmarks/pipeline_bench.py [--messages 5000] [--mix noise=0.55,mention=0.2,shill=0.15,rick=0.05,filtered=0.05]
+                                        [--database-url postgresql://...] [--output results.json] [--compare previous.json]
+
+Synthetic NewMessage events are pushed through worker.is_relevant and the real
+handler from worker.make_handler (Pipeline + WriteBehindWriter + RickDispatcher
+without a Telegram client). Without --database-url the tables live in a throwaway
+SQLite file (through aiosqlite) with bot_schema attached as a second database;
+with it, migrations are applied to that (ephemeral!) Postgres database first.
+
+Reports handler throughput, p50/p99 handler latency, end-to-end throughput
+including the final write-behind flush, and DB round trips per message (cursor
+executions counted with a before_cursor_execute listener). Results are written
+as JSON; --compare prints the change against an earlier result file.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MONITORED_CHAT = -1001000000001
+OTHER_CHAT = -1009999999999
+RICK_PEER = 7000000001
+DEFAULT_MIX = "noise=0.55,mention=0.2,shill=0.15,rick=0.05,filtered=0.05"
+
+NOISE = [
+    "gm degens, market looking spicy today 🔥",
+    "who is still holding? diamond hands only 💎🙌",
+    "dev just tweeted, something big coming",
+    "chart looks like it wants to break ATH, LFG",
+    "remember to take profits along the way",
+    "new listing on raydium in 10 minutes, stay tuned",
+]
+MENTION = [
+    "🚀 New gem just launched: {ca} — early entry!",
+    "CA: {ca}\nLP burned, mint revoked, socials live",
+    "aping this one {ca} 🤞",
+]
+RICK = (
+    "💊 Bench Coin [{fdv}/7%] $BENCH\n🌐 Solana @ Raydium\n💰 USD: $0.0001234\n"
+    "💎 FDV: ${fdv}\n💦 Liq: ${liq} [x4.2]\n📊 Vol: $1.1M Age: 2h\n"
+    "👥 TH: 5.1⋅3.2⋅2.9⋅2.0⋅1.8 [18%]\n\n{ca}"
+)
+
+_B58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+def random_solana_address(rng):
+    raw = bytes([rng.randrange(1, 256)]) + bytes(rng.randrange(256) for _ in range(31))
+    n = int.from_bytes(raw, 'big')
+    out = ''
+    while n:
+        n, r = divmod(n, 58)
+        out = _B58[r] + out
+    return out
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        kind, weight = part.split('=')
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {'noise', 'mention', 'shill', 'rick', 'filtered'}
+    if unknown:
+        raise SystemExit(f"unknown message kinds in --mix: {sorted(unknown)}")
+    return mix
+
+
+def fake_events(n, mix, seed=42, hot_cas=20):
+    """
+    Builds n events: noise, fresh CA mentions, repeated shills of a small hot
+    set (so velocity and upserts hit existing tokens), Rick Bot replies and
+    messages from unmonitored chats that the filter drops.
+    """
+    rng = random.Random(seed)
+    hot = [random_solana_address(rng) for _ in range(hot_cas)]
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=n)
+    events = []
+    for i, kind in enumerate(kinds):
+        chat_id, sender_id = MONITORED_CHAT, 100 + i % 50
+        if kind == 'noise':
+            text = rng.choice(NOISE)
+        elif kind == 'mention':
+            text = rng.choice(MENTION).format(ca=random_solana_address(rng))
+        elif kind == 'shill':
+            text = rng.choice(MENTION).format(ca=rng.choice(hot))
+        elif kind == 'rick':
+            chat_id, sender_id = RICK_PEER, RICK_PEER
+            text = RICK.format(ca=rng.choice(hot), fdv=f"{rng.randint(10, 900)}K", liq=f"{rng.randint(5, 90)}K")
+        else:
+            chat_id = OTHER_CHAT
+            text = rng.choice(NOISE)
+        message = SimpleNamespace(id=i + 1, message=text, reply_to_msg_id=None, entities=None,
+                                  date=datetime.now(timezone.utc))
+        events.append((kind, SimpleNamespace(chat_id=chat_id, sender_id=sender_id, message=message)))
+    return events
+
+
+def setup_database(url):
+    """
+    Points models at the benchmark database before anything imports it.
+    Returns a cleanup callable.
+    """
+    if url:
+        os.environ['DATABASE_URL'] = url
+        import migrations
+        migrations.upgrade()
+        return lambda: None
+
+    tmp = tempfile.TemporaryDirectory(prefix='pipeline_bench_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'main.db')}"
+    schema_db = os.path.join(tmp.name, 'bot_schema.db')
+
+    from sqlalchemy import event
+    import models
+
+    def attach(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"ATTACH DATABASE '{schema_db}' AS bot_schema")
+        cursor.close()
+
+    for engine in (models.engine, models.async_engine.sync_engine):
+        event.listen(engine, 'connect', attach)
+
+    models.Base.metadata.create_all(models.engine)
+    return lambda: (models.engine.dispose(), tmp.cleanup())
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run(events):
+    from sqlalchemy import event
+    import models
+    import metrics
+    import worker
+    from pipeline import Pipeline
+    from persistence import WriteBehindWriter
+    from rick_dispatch import RickDispatcher
+
+    round_trips = [0]
+
+    def count(*_args):
+        round_trips[0] += 1
+
+    for engine in (models.engine, models.async_engine.sync_engine):
+        event.listen(engine, 'before_cursor_execute', count)
+
+    worker.MONITORED_CHAT_IDS = frozenset({MONITORED_CHAT})
+    worker.RICK_BOT_PEER_ID = RICK_PEER
+
+    writer = WriteBehindWriter()
+    writer.start()
+    # Never started: submissions only exercise the dedup/priority queue
+    dispatcher = RickDispatcher(client=None, rick_bot_id=RICK_PEER)
+
+    async def dispatch(ca, score):
+        dispatcher.submit(ca, score)
+    handler = worker.make_handler(writer, dispatcher, Pipeline(writer, dispatch))
+
+    latencies = []
+    accepted = 0
+    started = time.perf_counter()
+    for _kind, ev in events:
+        t0 = time.perf_counter()
+        if worker.is_relevant(ev):
+            accepted += 1
+            await handler(ev)
+        latencies.append(time.perf_counter() - t0)
+    handler_elapsed = time.perf_counter() - started
+    await writer.drain()
+    total_elapsed = time.perf_counter() - started
+    await writer.close()
+    await models.async_engine.dispose()
+
+    latencies.sort()
+    stages = {name: m.snapshot() for name, m in metrics.REGISTRY.items()
+              if name.startswith(('pipeline_', 'handler_', 'write_', 'dedup_'))}
+    return {
+        "messages": len(events),
+        "accepted": accepted,
+        "handler_msgs_per_sec": round(len(events) / handler_elapsed, 1),
+        "end_to_end_msgs_per_sec": round(len(events) / total_elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "latency_max_ms": round(latencies[-1] * 1000, 4) if latencies else 0,
+        "db_round_trips": round_trips[0],
+        "db_round_trips_per_msg": round(round_trips[0] / len(events), 3),
+        "write_flush_errors": writer.failed_flushes,
+        "stages": stages,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(result, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nvs {previous_path} ({previous.get('revision')}):")
+    for key in ('handler_msgs_per_sec', 'end_to_end_msgs_per_sec', 'latency_p50_ms',
+                'latency_p99_ms', 'db_round_trips_per_msg'):
+        old, new = previous['results'].get(key), result['results'][key]
+        if old:
+            print(f"  {key:26s} {old:>12} -> {new:>12} ({(new - old) / old:+.1%})")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--messages', type=int, default=5000)
+    ap.add_argument('--mix', default=DEFAULT_MIX)
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--database-url', default=None,
+                    help='Postgres URL of a throwaway database (default: temporary SQLite)')
+    ap.add_argument('--output', default=None, help='JSON result path (default: print only)')
+    ap.add_argument('--compare', default=None, help='earlier JSON result to diff against')
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    cleanup = setup_database(args.database_url)
+    # Keep per-message prints from dominating the measurement
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    try:
+        results = asyncio.run(run(fake_events(args.messages, mix, args.seed)))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        cleanup()
+
+    result = {
+        "benchmark": "pipeline",
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "backend": 'postgresql' if args.database_url else 'sqlite',
+        "mix": mix,
+        "seed": args.seed,
+        "results": results,
+    }
+    summary = {k: v for k, v in results.items() if k != 'stages'}
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        compare(result, args.compare)
+    return 1 if results['write_flush_errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Scoring benchmark and scalar/columnar equivalence check.
+
+    python benchmarks/scoring_bench.py [--rows 100000]
+
+First checks that calculate_moonshot_score (the scalar wrapper) and score_arrays agree
+with a row-at-a-time reference of the original rules on random tokens, including
+missing values, then reports tokens/sec for both paths.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# scoring imports models, which builds an engine at import time; no connection is made
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import numpy as np
+from models import Token
+from scoring import score_arrays, notes_for, calculate_moonshot_score
+
+
+def reference_score(t):
+    """
+    The original per-token rules, kept verbatim as the oracle.
+    """
+    score = 0
+    notes = []
+    if t['mentions_5m'] >= 3:
+        score += 30
+        notes.append("🔥 High Social Velocity (5m)")
+    elif t['mentions_15m'] >= 5:
+        score += 20
+        notes.append("📈 Growing Interest (15m)")
+    if t['liquidity'] and t['fdv']:
+        liq_to_mc = (float(t['liquidity']) / float(t['fdv'])) * 100
+        if 5 <= liq_to_mc <= 25:
+            score += 20
+            notes.append("✅ Healthy Liquidity/MC ratio")
+        elif liq_to_mc < 2:
+            score -= 10
+            notes.append("⚠️ Extremely Low Liquidity (High Risk)")
+    if t['rick_score']:
+        score += max(0, 30 - t['rick_score'])
+        if t['rick_score'] < 5:
+            notes.append("🛡️ Clean Audit from Rick Bot")
+    if t['top_holders_percent']:
+        if t['top_holders_percent'] > 40:
+            score -= 20
+            notes.append("🚨 Top Holders > 40% (Potential Rug)")
+        elif t['top_holders_percent'] < 15:
+            score += 10
+            notes.append("💎 Great Holder Distribution")
+    score = min(100, max(0, score))
+    return score, score >= 80, " | ".join(notes)
+
+
+def random_tokens(n, seed=42):
+    rng = random.Random(seed)
+    maybe = lambda v: rng.choice([None, 0, v])
+    return [{
+        "liquidity": maybe(Decimal(str(round(rng.uniform(100, 200_000), 2)))),
+        "fdv": maybe(Decimal(str(round(rng.uniform(1_000, 2_000_000), 2)))),
+        "rick_score": maybe(rng.randint(0, 40)),
+        "top_holders_percent": maybe(Decimal(str(round(rng.uniform(0, 90), 1)))),
+        "mentions_5m": rng.randint(0, 6),
+        "mentions_15m": rng.randint(0, 10),
+    } for _ in range(n)]
+
+
+def check_equivalence(rows):
+    failures = 0
+    cols = {k: [r[k] for r in rows] for k in rows[0]}
+    scores, gold, bits = score_arrays(cols['liquidity'], cols['fdv'], cols['rick_score'],
+                                      cols['top_holders_percent'], cols['mentions_5m'], cols['mentions_15m'])
+    notes = notes_for(bits)
+    for i, r in enumerate(rows):
+        expected = reference_score(r)
+        token = calculate_moonshot_score(Token(**r))
+        scalar = (token.moonshot_score, token.is_gold, token.trader_notes)
+        columnar = (float(scores[i]), bool(gold[i]), notes[i])
+        if scalar != expected or columnar != expected:
+            failures += 1
+            if failures <= 5:
+                print(f"MISMATCH {r}\n  expected {expected}\n  scalar   {scalar}\n  columnar {columnar}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=100_000)
+    ap.add_argument('--check-rows', type=int, default=5_000)
+    args = ap.parse_args()
+
+    failures = check_equivalence(random_tokens(args.check_rows, seed=7))
+    print(f"equivalence:   {args.check_rows} tokens, {failures} mismatches")
+
+    rows = random_tokens(args.rows)
+    # Columnar input as the rescoring job sees it: float arrays with NaN for missing
+    cols = {k: np.array([np.nan if r[k] is None else float(r[k]) for r in rows]) for k in rows[0]}
+    started = time.perf_counter()
+    scores, gold, bits = score_arrays(cols['liquidity'], cols['fdv'], cols['rick_score'],
+                                      cols['top_holders_percent'], cols['mentions_5m'], cols['mentions_15m'])
+    notes_for(bits)
+    columnar = args.rows / (time.perf_counter() - started)
+
+    sample = [Token(**r) for r in rows[:10_000]]
+    started = time.perf_counter()
+    for token in sample:
+        calculate_moonshot_score(token)
+    scalar = len(sample) / (time.perf_counter() - started)
+
+    print(f"score_arrays:  {columnar:,.0f} tokens/sec ({args.rows:,} rows)")
+    print(f"scalar path:   {scalar:,.0f} tokens/sec")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,29 @@
 import streamlit as st
 import pandas as pd
-from models import SessionLocal, Token, HolderAnalysis, Message, TargetChannel
-from sqlalchemy import func, desc
+from models import SessionLocal, Token, TokenAudit, HolderAnalysis, Message, TargetChannel
+from leaderboard import TOKEN_COLUMNS, LEADERBOARD_SIZE, display_fields, load_leaderboard
+from audits import unpack
+from sqlalchemy import func, desc, asc, select, text
 import os
 
+# Short TTL shared by every rerun/viewer; raw audits change rarely so they live longer
+CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '10'))
+RAW_CACHE_TTL = int(os.getenv('DASHBOARD_RAW_CACHE_TTL', '300'))
+PAGE_SIZE = 50
+
+SORT_COLUMNS = {
+    "Score": Token.moonshot_score,
+    "Newest": Token.created_at,
+    "5m Mentions": Token.mentions_5m,
+    "1h Mentions": Token.mentions_1h,
+    "FDV": Token.fdv,
+    "Liquidity": Token.liquidity,
+}
+# Unaudited tokens have no FDV or liquidity yet; the other columns have
+# defaults, and NULLS LAST would keep Score and Newest off their m007 indexes
+NULLABLE_SORTS = {"FDV", "Liquidity"}
+
+
 st.set_page_config(page_title="Professional Memecoin Terminal", layout="wide")
 
 st.title("🚀 Professional Memecoin Terminal")
@@ -12,78 +32,190 @@ st.title("🚀 Professional Memecoin Terminal")
 st.sidebar.header("Professional Trader View")
 st.sidebar.info("""
 **Current Sentiment:** High Risk / Degenerate
-**Note:** Many tokens are launching on Pump.fun. 
+**Note:** Many tokens are launching on Pump.fun.
 Focus on Liquidity/MC ratio. If < 5%, high risk of rug.
 Check Top 10 Holder concentration. > 30% is a flag.
 """)
 
-db = SessionLocal()
 
-def load_data():
-    tokens = db.query(Token).order_by(Token.moonshot_score.desc()).all()
-    if not tokens:
-        return pd.DataFrame()
+def _rows(stmt):
+    with SessionLocal() as db:
+        return [dict(r._mapping) for r in db.execute(stmt)]
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def count_tokens():
+    with SessionLocal() as db:
+        return db.execute(select(func.count(Token.id))).scalar() or 0
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_radar(page=0, page_size=PAGE_SIZE):
+    # Precomputed by the worker (see leaderboard.py): one page of the ranking, gold and latest
+    with SessionLocal() as db:
+        entries = load_leaderboard(db, page, page_size)
+
+    def ranked(key):
+        return sorted((e for e in entries if e[key] is not None), key=lambda e: e[key])
+    return ranked('score_rank'), ranked('gold_rank'), ranked('latest_rank')
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_tokens(sort_by="Score", descending=True, page=0, page_size=PAGE_SIZE):
+    # Other orderings and pages past the leaderboard still read tokens directly
+    column = (desc if descending else asc)(SORT_COLUMNS[sort_by])
+    if sort_by in NULLABLE_SORTS:
+        column = column.nulls_last()
+    stmt = (select(*TOKEN_COLUMNS)
+            .order_by(column, Token.id)
+            .limit(page_size).offset(page * page_size))
+    return [dict(display_fields(t), id=t['id']) for t in _rows(stmt)]
+
+
+@st.cache_data(ttl=RAW_CACHE_TTL)
+def load_raw_response(token_id):
+    with SessionLocal() as db:
+        raw = db.execute(select(TokenAudit.raw).join(Token, Token.latest_audit_id == TokenAudit.id)
+                         .where(Token.id == token_id)).scalar()
+    return unpack(raw)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_holders(limit=200):
+    stmt = (select(HolderAnalysis.wallet_address, HolderAnalysis.wallet_age_days,
+                   HolderAnalysis.trading_style, HolderAnalysis.win_rate)
+            .order_by(HolderAnalysis.last_updated.desc()).limit(limit))
+    return _rows(stmt)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_messages(limit=50):
+    stmt = (select(Message.timestamp, Message.channel_id, Message.sender_id,
+                   func.left(Message.text, 100).label('text'), func.length(Message.text).label('length'))
+            .order_by(desc(Message.timestamp)).limit(limit))
+    return _rows(stmt)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_channels():
+    stmt = (select(TargetChannel.id, TargetChannel.identifier, TargetChannel.name, TargetChannel.is_active)
+            .order_by(TargetChannel.created_at.desc()))
+    return _rows(stmt)
+
+
+def notify_channels_changed(db):
+    # Wakes the worker's refresh_channels right away; delivered when db commits
+    db.execute(text("SELECT pg_notify('target_channels', '')"))
+
+
+def add_channel(identifier):
+    with SessionLocal() as db:
+        db.add(TargetChannel(identifier=identifier, name=None)) # Name will be resolved by worker
+        notify_channels_changed(db)
+        db.commit()
+    load_channels.clear()
+
+
+def toggle_channel(channel_id):
+    with SessionLocal() as db:
+        c = db.get(TargetChannel, channel_id)
+        if c:
+            c.is_active = not c.is_active
+            notify_channels_changed(db)
+            db.commit()
+    load_channels.clear()
+
+
+def delete_channel(channel_id):
+    with SessionLocal() as db:
+        c = db.get(TargetChannel, channel_id)
+        if c:
+            db.delete(c)
+            notify_channels_changed(db)
+            db.commit()
+    load_channels.clear()
+
+
+def token_table(tokens):
     return pd.DataFrame([{
-        "Score": f"⭐ {t.moonshot_score:.0f}/100" if t.is_gold else f"{t.moonshot_score:.0f}/100",
-        "Symbol": t.symbol,
-        "CA": t.contract_address,
-        "5m/15m/1h Mentions": f"{t.mentions_5m} / {t.mentions_15m} / {t.mentions_1h}",
-        "FDV": f"${t.fdv:,.0f}" if t.fdv else "N/A",
-        "Liquidity": f"${t.liquidity:,.0f}" if t.liquidity else "N/A",
-        "Trader Notes": t.trader_notes or "Analyzing...",
-        "Risk": "Low" if t.moonshot_score > 70 else ("High" if t.moonshot_score < 30 else "Moderate")
+        "Score": t['score_label'],
+        "Symbol": t['symbol'],
+        "CA": t['contract_address'],
+        "5m/15m/1h Mentions": t['mentions_label'],
+        "FDV": t['fdv_label'],
+        "Liquidity": t['liquidity_label'],
+        "Trader Notes": t['trader_notes'] or "Analyzing...",
+        "Risk": t['risk'],
     } for t in tokens])
 
-df = load_data()
+
+def raw_response_section(token_id, label, key, as_code=False):
+    # Expanders always render their body, so the raw text waits for an explicit toggle
+    if st.toggle(label, key=key):
+        raw = load_raw_response(token_id)
+        if raw and as_code:
+            st.code(raw)
+        elif raw:
+            st.text(raw)
+        else:
+            st.caption("No Rick Bot response stored yet.")
+
 
 tabs = st.tabs(["🚀 Moonshot Radar", "🔍 Wallet Behavioral Analysis", "🔥 Raw Feed", "⚙️ Channel Manager", "🧠 ML & Strategy Insights"])
 
 with tabs[0]:
     st.subheader("Real-time Moonshot Radar (Sorted by Potential)")
-    if not df.empty:
-        # Style the dataframe (optional)
-        st.dataframe(df, width='stretch', hide_index=True)
-        
+    total = count_tokens()
+    if total:
+        col_sort, col_dir, col_page = st.columns([2, 1, 1])
+        with col_sort:
+            sort_by = st.selectbox("Sort by", list(SORT_COLUMNS), index=0)
+        with col_dir:
+            descending = st.radio("Order", ["Desc", "Asc"], horizontal=True) == "Desc"
+        with col_page:
+            pages = max(1, -(-total // PAGE_SIZE))
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1) - 1
+
+        ranking, gold_tokens, latest_tokens = load_radar(page)
+        # An empty ranking means the worker has not built the leaderboard yet
+        if not (ranking and sort_by == "Score" and descending and (page + 1) * PAGE_SIZE <= LEADERBOARD_SIZE):
+            ranking = load_tokens(sort_by, descending, page)
+        st.dataframe(token_table(ranking), width='stretch', hide_index=True)
+
         # High Conviction Section
-        gold_tokens = db.query(Token).filter(Token.is_gold == True).order_by(Token.created_at.desc()).all()
         if gold_tokens:
             st.success(f"⚡ FOUND {len(gold_tokens)} HIGH CONVICTION (GOLD) TOKENS!")
             for gt in gold_tokens:
-                with st.expander(f"💰 {gt.symbol} | Score: {gt.moonshot_score:.0f} | CA: {gt.contract_address}"):
-                    st.write(f"**Notes:** {gt.trader_notes}")
-                    st.write(f"**Mentions Intensity:** {gt.mentions_5m} mentions in last 5 mins.")
-                    if gt.raw_response:
-                        st.write("**Raw Rick Bot Data:**")
-                        st.code(gt.raw_response)
-        
+                with st.expander(f"💰 {gt['symbol']} | Score: {gt['score_text']} | CA: {gt['contract_address']}"):
+                    st.write(f"**Notes:** {gt['trader_notes']}")
+                    st.write(f"**Mentions Intensity:** {gt['mentions_5m']} mentions in last 5 mins.")
+                    raw_response_section(gt['token_id'], "Show Raw Rick Bot Data", f"raw_gold_{gt['token_id']}", as_code=True)
+
         st.write("---")
         st.subheader("All Detected Tokens")
-        all_tokens = db.query(Token).order_by(Token.created_at.desc()).limit(20).all()
-        for t in all_tokens:
-            with st.expander(f"{'⭐' if t.is_gold else '•'} {t.symbol or 'Unknown'} | Score: {t.moonshot_score:.0f} | CA: {t.contract_address}"):
+        for t in latest_tokens:
+            with st.expander(f"{'⭐' if t['is_gold'] else '•'} {t['symbol'] or 'Unknown'} | Score: {t['score_text']} | CA: {t['contract_address']}"):
                  col_a, col_b = st.columns(2)
                  with col_a:
-                     st.write(f"**FDV:** ${t.fdv:,.0f}" if t.fdv else "**FDV:** N/A")
-                     st.write(f"**Liq:** ${t.liquidity:,.0f}" if t.liquidity else "**Liq:** N/A")
+                     st.write(f"**FDV:** {t['fdv_label']}")
+                     st.write(f"**Liq:** {t['liquidity_label']}")
                  with col_b:
-                     st.write(f"**Score:** {t.moonshot_score:.0f}/100")
-                     st.write(f"**Risk:** {t.audit_status or 'Unknown'}")
-                 
-                 if t.raw_response:
-                     st.write("**Full Raw Data:**")
-                     st.text(t.raw_response)
+                     st.write(f"**Score:** {t['score_text']}/100")
+                     st.write(f"**Risk:** {t['audit_status'] or 'Unknown'}")
+
+                 raw_response_section(t['token_id'], "Show Full Raw Data", f"raw_latest_{t['token_id']}")
     else:
         st.info("Listening for new tokens on Telegram... Momentum is coming.")
 
 with tabs[1]:
     st.subheader("Top Holder Behavioral Profiling")
-    profiles = db.query(HolderAnalysis).all()
+    profiles = load_holders()
     if profiles:
         prof_df = pd.DataFrame([{
-            "Wallet": p.wallet_address,
-            "Age (Days)": p.wallet_age_days,
-            "Style": p.trading_style,
-            "Win Rate": f"{p.win_rate * 100:.0f}%"
+            "Wallet": p['wallet_address'],
+            "Age (Days)": p['wallet_age_days'],
+            "Style": p['trading_style'],
+            "Win Rate": f"{(p['win_rate'] or 0) * 100:.0f}%"
         } for p in profiles])
         st.table(prof_df)
     else:
@@ -91,13 +223,13 @@ with tabs[1]:
 
 with tabs[2]:
     st.subheader("🔥 Recent Telegram Activity (Live Feed)")
-    msgs = db.query(Message).order_by(desc(Message.timestamp)).limit(50).all()
+    msgs = load_messages()
     if msgs:
         msg_df = pd.DataFrame([{
-            "Time": m.timestamp.strftime("%H:%M:%S"),
-            "Channel ID": m.channel_id,
-            "Sender": m.sender_id,
-            "Message": m.text[:100] + "..." if len(m.text) > 100 else m.text
+            "Time": m['timestamp'].strftime("%H:%M:%S"),
+            "Channel ID": m['channel_id'],
+            "Sender": m['sender_id'],
+            "Message": m['text'] + "..." if (m['length'] or 0) > 100 else m['text']
         } for m in msgs])
         st.dataframe(msg_df, width='stretch', hide_index=True)
     else:
@@ -105,13 +237,14 @@ with tabs[2]:
 
 with tabs[3]:
     st.subheader("⚙️ Channel Management")
-    
+
     # 1. Add New Channel
     with st.expander("➕ Add New Target Channel"):
         st.info("""
         **Format Guide:**
         - **Channel ID**: Biasanya diawali dengan `-100` (contoh: `-100123456789`). Masukkan lengkap dengan tanda minusnya.
         - **Username**: Awali dengan `@` (contoh: `@DexScreenerCalls`).
+        - **History**: Jalankan `python backfill.py channel <ID atau @username>` untuk memuat pesan lama.
         """)
         new_id = st.text_input("Channel ID or @username", placeholder="-100xxxxxxx or @username")
         if st.button("Add Channel"):
@@ -119,9 +252,7 @@ with tabs[3]:
                 try:
                     # Clean input
                     new_id_clean = new_id.strip()
-                    ch = TargetChannel(identifier=new_id_clean, name=None) # Name will be resolved by worker
-                    db.add(ch)
-                    db.commit()
+                    add_channel(new_id_clean)
                     st.success(f"Added {new_id_clean}! Menunggu worker mengambil nama channel...")
                     st.rerun()
                 except Exception as e:
@@ -131,24 +262,22 @@ with tabs[3]:
 
     # 2. List & Toggle Channels
     st.write("---")
-    channels = db.query(TargetChannel).order_by(TargetChannel.created_at.desc()).all()
+    channels = load_channels()
     if channels:
         for c in channels:
             col1, col2, col3 = st.columns([3, 1, 1])
             with col1:
-                display_name = c.name if c.name else "⏳ *Fetching name from Telegram...*"
+                display_name = c['name'] if c['name'] else "⏳ *Fetching name from Telegram...*"
                 st.write(f"**{display_name}**")
-                st.caption(f"ID: `{c.identifier}`")
+                st.caption(f"ID: `{c['identifier']}`")
             with col2:
-                status = "✅ Active" if c.is_active else "❌ Inactive"
-                if st.button(status, key=f"toggle_{c.id}"):
-                    c.is_active = not c.is_active
-                    db.commit()
+                status = "✅ Active" if c['is_active'] else "❌ Inactive"
+                if st.button(status, key=f"toggle_{c['id']}"):
+                    toggle_channel(c['id'])
                     st.rerun()
             with col3:
-                if st.button("🗑️ Delete", key=f"del_{c.id}"):
-                    db.delete(c)
-                    db.commit()
+                if st.button("🗑️ Delete", key=f"del_{c['id']}"):
+                    delete_channel(c['id'])
                     st.rerun()
     else:
         st.write("No target channels configured.")
@@ -160,4 +289,5 @@ with tabs[4]:
     st.info("Segmentasi: Token dengan mention > 3 dalam 5 menit memiliki probabilitas pump 70%.")
 
 if st.button("Refresh Data"):
+    st.cache_data.clear()
     st.rerun()
@@ -0,0 +1,90 @@
+import os
+import re
+import time
+import hashlib
+import unicodedata
+from collections import OrderedDict
+import metrics
+from parser import CA_PATTERN
+
+# How long a message body is remembered, and how many bodies at most
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', '900'))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', '50000'))
+
+_lookups = metrics.counter('dedup_lookups_total', 'Channel messages checked against the duplicate filter')
+_hits = metrics.counter('dedup_hits_total', 'Channel messages recognised as repeats of a recent message')
+_hit_rate = metrics.gauge('dedup_hit_rate', 'Share of channel messages that were repeats')
+_entries = metrics.gauge('dedup_entries', 'Message hashes currently remembered')
+
+_URL = re.compile(r'https?://\S+|t\.me/\S+')
+_NOT_WORD = re.compile(r'[\W_]+')
+
+
+def _link_cas(m):
+    # pump.fun, dexscreener and explorer links carry the CA in their path or query
+    return ' ' + ' '.join(ca.group(0) for ca in CA_PATTERN.finditer(m.group(0))) + ' '
+
+
+def normalize(text):
+    """
+    Folds the differences cross-posts and forwards usually add: emoji,
+    punctuation, whitespace and links (often rewritten per channel), of
+    which only the CAs they carry are kept. Case is kept, as it is in
+    Solana addresses.
+    """
+    text = unicodedata.normalize('NFKC', text)
+    return _NOT_WORD.sub(' ', _URL.sub(_link_cas, text)).strip()
+
+
+def content_key(text):
+    """
+    64-bit hash of the normalised text, or None when nothing is left to
+    compare. Every CA extract_cas can find in text is still in it.
+    """
+    body = normalize(text)
+    if not body:
+        return None
+    return int.from_bytes(hashlib.blake2b(body.encode(), digest_size=8).digest(), 'big')
+
+
+class RecentMessages:
+    """
+    Time-expiring, size-bounded map of recent message hashes to the CAs
+    extracted from the first copy, so repeats skip extraction. Entries expire
+    DEDUP_TTL after first sight.
+    """
+
+    def __init__(self, ttl=DEDUP_TTL, max_entries=DEDUP_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, cas), oldest first
+
+    def _expire(self, now):
+        entries = self._entries
+        while entries:
+            key, (expires_at, _) = next(iter(entries.items()))
+            if expires_at > now and len(entries) <= self.max_entries:
+                break
+            del entries[key]
+
+    def get(self, key, now=None):
+        """
+        The CAs of a recent copy of this message, or None if it is new.
+        """
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        entry = self._entries.get(key)
+        _lookups.inc()
+        if entry is not None:
+            _hits.inc()
+        _hit_rate.set(round(_hits.value / _lookups.value, 4))
+        return entry[1] if entry is not None else None
+
+    def put(self, key, cas, now=None):
+        now = time.monotonic() if now is None else now
+        self._entries[key] = (now + self.ttl, tuple(cas))
+        self._expire(now)
+        _entries.set(len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import AsyncSessionLocal, TokenHolder
+from analysis import HELIUS_API_KEY, get_analyzer
+import metrics
+
+# A batch is profiled once it holds this many distinct wallets or has waited this long
+HOLDER_BATCH_SIZE = int(os.getenv('HOLDER_BATCH_SIZE', '50'))
+HOLDER_BATCH_INTERVAL = float(os.getenv('HOLDER_BATCH_INTERVAL', '5'))
+HOLDER_QUEUE_MAX = int(os.getenv('HOLDER_QUEUE_MAX', '1000'))
+# What makes a wallet smart money: enough closed trades, mostly profitable, not a bot
+SMART_MONEY_MIN_WIN_RATE = float(os.getenv('SMART_MONEY_MIN_WIN_RATE', '0.6'))
+SMART_MONEY_MIN_SELLS = int(os.getenv('SMART_MONEY_MIN_SELLS', '5'))
+
+_queue_depth = metrics.gauge('holder_queue_depth', 'Audits waiting for holder profiling')
+_dropped = metrics.counter('holder_audits_dropped_total', 'Audits whose holders were skipped because the queue was full')
+_wallets = metrics.counter('holder_wallets_profiled_total', 'Distinct holder wallets profiled')
+_batch_latency = metrics.histogram('holder_batch_seconds', 'Time to profile and store one batch of holders',
+                                   buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+
+
+def is_smart_money(profile):
+    if not profile or 'wallet_address' not in profile:
+        return False
+    return (
+        profile.get('trading_style') != "High Frequency/Bot"
+        and (profile.get('sell_count') or 0) >= SMART_MONEY_MIN_SELLS
+        and float(profile.get('win_rate') or 0) >= SMART_MONEY_MIN_WIN_RATE
+    )
+
+
+def smart_money_ratio(wallets, profiles):
+    """
+    Share of the successfully profiled wallets that are smart money, or None if none were profiled.
+    """
+    profiled = [profiles[w] for w in wallets if profiles.get(w) and 'wallet_address' in profiles[w]]
+    if not profiled:
+        return None
+    return round(sum(map(is_smart_money, profiled)) / len(profiled), 4)
+
+
+class HolderProfiler:
+    """
+    Profiles the top-holder wallets of audited tokens off the hot path.
+
+    Audits are queued with submit(); a background task batches them, profiles
+    each distinct wallet once per batch through analysis.WalletAnalyzer (which
+    also skips wallets with a fresh stored profile and bulk-upserts
+    holders_analysis), replaces the tokens' token_holders rows and feeds each
+    token's smart_money_ratio back through the writer, which rescores it.
+    """
+
+    def __init__(self, analyzer, writer, session_factory=AsyncSessionLocal,
+                 batch_size=HOLDER_BATCH_SIZE, batch_interval=HOLDER_BATCH_INTERVAL,
+                 max_queue=HOLDER_QUEUE_MAX):
+        self.analyzer = analyzer
+        self.writer = writer
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def submit(self, ca, holders):
+        """
+        Queues [(wallet, percent)] for ca without waiting; dropped if the queue is full.
+        """
+        try:
+            self.queue.put_nowait((ca, list(holders)))
+        except asyncio.QueueFull:
+            _dropped.inc()
+        _queue_depth.set(self.queue.qsize())
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            wallets = {w for w, _ in batch[0][1]}
+            deadline = time.monotonic() + self.batch_interval
+            while len(wallets) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                wallets.update(w for w, _ in item[1])
+            _queue_depth.set(self.queue.qsize())
+            try:
+                await self.process(batch)
+            except Exception as e:
+                print(f"Error profiling holders for {len(batch)} tokens: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def process(self, batch):
+        """
+        Profiles, stores and scores one batch of (ca, [(wallet, percent)]).
+        Returns {ca: smart_money_ratio}.
+        """
+        started = time.perf_counter()
+        holders_by_ca = dict(batch) # a later audit of the same token wins
+        wallets = list(dict.fromkeys(w for holders in holders_by_ca.values() for w, _ in holders))
+        profiles = await self.analyzer.profile_many(wallets)
+        _wallets.inc(len(wallets))
+
+        await self._store_holders(holders_by_ca)
+        ratios = {}
+        for ca, holders in holders_by_ca.items():
+            ratio = smart_money_ratio([w for w, _ in holders], profiles)
+            if ratio is not None:
+                ratios[ca] = ratio
+                await self.writer.update_token(ca, {"smart_money_ratio": ratio})
+        _batch_latency.observe(time.perf_counter() - started)
+        return ratios
+
+    async def _store_holders(self, holders_by_ca):
+        table = TokenHolder.__table__
+        now = datetime.utcnow()
+        rows = [
+            {"contract_address": ca, "wallet_address": wallet, "rank": rank, "percent": percent, "seen_at": now}
+            for ca, holders in holders_by_ca.items()
+            for rank, (wallet, percent) in enumerate(holders, 1)
+        ]
+        async with self.session_factory() as db:
+            # Each audit replaces the token's holder list
+            await db.execute(delete(table).where(table.c.contract_address.in_(list(holders_by_ca))))
+            if rows:
+                await db.execute(pg_insert(table).values(rows).on_conflict_do_nothing())
+            await db.commit()
+
+    async def drain(self):
+        await self.queue.join()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+def start_profiler(writer):
+    """
+    Starts a HolderProfiler on the shared WalletAnalyzer, or returns None.
+    Holder profiling needs Helius; without a key audits are scored without it.
+    """
+    if not HELIUS_API_KEY:
+        return None
+    profiler = HolderProfiler(get_analyzer(), writer)
+    profiler.start()
+    return profiler
+
+
+async def stop_profiler(profiler):
+    if profiler is not None:
+        await profiler.close()
+        await profiler.analyzer.close()
@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from sqlalchemy import select, delete, insert, or_
+from models import SessionLocal, Token, LeaderboardEntry
+import metrics
+
+# How often the snapshot is rebuilt, and how much of it the radar can page through
+LEADERBOARD_INTERVAL = int(os.getenv('LEADERBOARD_INTERVAL', '10'))
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '500'))
+GOLD_LIMIT = 50
+LATEST_LIMIT = 20
+
+_refresh_seconds = metrics.histogram('leaderboard_refresh_seconds', 'Duration of one leaderboard rebuild')
+
+TOKEN_COLUMNS = (
+    Token.id, Token.moonshot_score, Token.is_gold, Token.symbol, Token.contract_address,
+    Token.mentions_5m, Token.mentions_15m, Token.mentions_1h, Token.fdv, Token.liquidity,
+    Token.trader_notes, Token.audit_status, Token.created_at,
+)
+
+
+def display_fields(t):
+    """
+    The radar's text for one token row (a mapping with TOKEN_COLUMNS keys).
+    """
+    score = float(t['moonshot_score'] or 0)
+    return {
+        "score_text": f"{score:.0f}",
+        "score_label": f"⭐ {score:.0f}/100" if t['is_gold'] else f"{score:.0f}/100",
+        "symbol": t['symbol'],
+        "contract_address": t['contract_address'],
+        "mentions_5m": t['mentions_5m'] or 0,
+        "mentions_label": f"{t['mentions_5m']} / {t['mentions_15m']} / {t['mentions_1h']}",
+        "fdv_label": f"${t['fdv']:,.0f}" if t['fdv'] else "N/A",
+        "liquidity_label": f"${t['liquidity']:,.0f}" if t['liquidity'] else "N/A",
+        "trader_notes": t['trader_notes'],
+        "risk": "Low" if score > 70 else ("High" if score < 30 else "Moderate"),
+        "audit_status": t['audit_status'],
+        "is_gold": bool(t['is_gold']),
+    }
+
+
+def build_entries(db, size=LEADERBOARD_SIZE):
+    """
+    Ranks the top tokens by score plus the newest gold and newest tokens,
+    one row per token with every rank it holds.
+    """
+    ranked = {}
+
+    def rank(stmt, key):
+        for i, r in enumerate(db.execute(stmt), 1):
+            row = ranked.get(r.id)
+            if row is None:
+                row = ranked[r.id] = dict(display_fields(r._mapping), token_id=r.id,
+                                          score_rank=None, gold_rank=None, latest_rank=None)
+            row[key] = i
+
+    # Both columns have defaults, so these orderings match the m007 DESC indexes
+    newest = Token.created_at.desc()
+    rank(select(*TOKEN_COLUMNS).order_by(Token.moonshot_score.desc(), Token.id).limit(size),
+         'score_rank')
+    rank(select(*TOKEN_COLUMNS).where(Token.is_gold == True).order_by(newest, Token.id).limit(GOLD_LIMIT),
+         'gold_rank')
+    rank(select(*TOKEN_COLUMNS).order_by(newest, Token.id).limit(LATEST_LIMIT), 'latest_rank')
+    return list(ranked.values())
+
+
+def refresh_leaderboard(session_factory=SessionLocal, size=LEADERBOARD_SIZE):
+    """
+    Replaces the leaderboard snapshot in one transaction, so readers always
+    see a complete ranking. Returns the number of rows written.
+    """
+    started = time.perf_counter()
+    refreshed_at = datetime.utcnow()
+    with session_factory() as db:
+        entries = [dict(e, refreshed_at=refreshed_at) for e in build_entries(db, size)]
+        table = LeaderboardEntry.__table__
+        db.execute(delete(table))
+        if entries:
+            db.execute(insert(table), entries)
+        db.commit()
+    _refresh_seconds.observe(time.perf_counter() - started)
+    return len(entries)
+
+
+def load_leaderboard(db, page=0, page_size=GOLD_LIMIT):
+    """
+    Everything the radar shows in one indexed read: one page of the score
+    ranking plus the gold and latest lists.
+    """
+    t = LeaderboardEntry.__table__
+    first = page * page_size
+    stmt = select(t).where(or_(
+        t.c.score_rank.between(first + 1, first + page_size),
+        t.c.gold_rank.isnot(None),
+        t.c.latest_rank.isnot(None),
+    ))
+    return [dict(r._mapping) for r in db.execute(stmt)]
+
+
+async def leaderboard_loop(interval=LEADERBOARD_INTERVAL):
+    """
+    Keeps the snapshot current; one writer for every dashboard viewer.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(refresh_leaderboard)
+        except Exception as e:
+            print(f"Error refreshing leaderboard: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    print(f"Leaderboard rebuilt with {refresh_leaderboard()} tokens.")
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local Prometheus endpoint (0 disables) and interval of the structured log line
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+METRICS_LOG_INTERVAL = int(os.getenv('METRICS_LOG_INTERVAL', '60'))
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+REGISTRY = {}
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text=''):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help_text=''):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (inf if it overflowed the buckets).
+        """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+def _get_or_create(cls, name, help_text, **kwargs):
+    with _lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = cls(name, help_text, **kwargs)
+            REGISTRY[name] = metric
+        return metric
+
+
+def counter(name, help_text=''):
+    return _get_or_create(Counter, name, help_text)
+
+
+def gauge(name, help_text=''):
+    return _get_or_create(Gauge, name, help_text)
+
+
+def histogram(name, help_text='', buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, help_text, buckets=buckets)
+
+
+def snapshot():
+    """
+    Returns a plain dict of every registered metric.
+    """
+    return {name: m.snapshot() for name, m in sorted(REGISTRY.items())}
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    """
+    Renders every registered metric in the Prometheus text format.
+    """
+    lines = []
+    for name, m in sorted(REGISTRY.items()):
+        if m.help:
+            lines.append(f"# HELP {name} {m.help}")
+        lines.append(f"# TYPE {name} {m.kind}")
+        if m.kind == 'histogram':
+            cumulative = 0
+            for bound, n in zip(m.buckets, m.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{le="{_format_value(float(bound))}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {m.count}')
+            lines.append(f"{name}_sum {_format_value(m.sum)}")
+            lines.append(f"{name}_count {m.count}")
+        else:
+            lines.append(f"{name} {_format_value(m.value)}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = exposition().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=METRICS_PORT, host='127.0.0.1'):
+    """
+    Serves /metrics from a daemon thread. Returns the server, or None when
+    disabled or the port is taken (metrics then only reach the log line).
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint disabled, cannot bind {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_port}/metrics")
+    return server
+
+
+async def log_loop(interval=METRICS_LOG_INTERVAL):
+    """
+    Prints one JSON line with every metric, for log-based dashboards.
+    """
+    while interval:
+        await asyncio.sleep(interval)
+        print(json.dumps({"event": "metrics", "ts": time.time(), "metrics": snapshot()}, default=str))
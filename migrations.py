@@ -0,0 +1,666 @@
+import os
+import sys
+import psycopg2
+from psycopg2.extras import execute_values
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+SCHEMA = 'bot_schema'
+# Tables stored as daily range partitions on "timestamp"
+PARTITIONED_TABLES = ('messages', 'token_mentions')
+PARTITION_DAYS_AHEAD = int(os.getenv('PARTITION_DAYS_AHEAD', '7'))
+# Partitions older than this many days are dropped by `maintain` (0 keeps everything)
+RETENTION_DAYS = {
+    'messages': int(os.getenv('MESSAGES_RETENTION_DAYS', '30')),
+    'token_mentions': int(os.getenv('TOKEN_MENTIONS_RETENTION_DAYS', '0')),
+}
+# token_mentions older than this are rolled into per-minute buckets, and those into hourly ones
+RAW_MENTIONS_SECONDS = int(os.getenv('RAW_MENTIONS_SECONDS', '3600'))
+MINUTE_ROLLUP_SECONDS = int(os.getenv('MINUTE_ROLLUP_SECONDS', str(24 * 3600)))
+
+# Arbitrary key for pg_advisory_lock so only one runner migrates at a time
+_LOCK_KEY = 7345021
+# Same for compact_mentions
+_COMPACT_LOCK_KEY = 7345022
+
+
+# --- Migrations -------------------------------------------------------------
+# Each one must be safe to run against a database that was set up by the old
+# standalone scripts (setup_schema.py, migrate_db.py, migrate_v2.py, migrate_v3.py).
+
+def m001_schema(cur):
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA} AUTHORIZATION CURRENT_USER;")
+    cur.execute(f"ALTER ROLE CURRENT_USER SET search_path TO {SCHEMA}, public;")
+
+
+def m002_base_tables(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.tokens (
+            id SERIAL PRIMARY KEY,
+            contract_address VARCHAR UNIQUE,
+            symbol VARCHAR,
+            name VARCHAR,
+            platform VARCHAR,
+            fdv NUMERIC,
+            liquidity NUMERIC,
+            volume_24h NUMERIC,
+            top_holders_percent NUMERIC,
+            rick_score INTEGER,
+            audit_status VARCHAR,
+            pump_prob NUMERIC,
+            best_entry_time TIMESTAMP,
+            created_at TIMESTAMP
+        );
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.holders_analysis (
+            wallet_address VARCHAR PRIMARY KEY,
+            wallet_age_days INTEGER,
+            total_volume_sol NUMERIC,
+            trading_style VARCHAR,
+            win_rate NUMERIC,
+            last_updated TIMESTAMP
+        );
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.token_mentions (
+            id SERIAL PRIMARY KEY,
+            contract_address VARCHAR,
+            source_channel VARCHAR,
+            timestamp TIMESTAMP
+        );
+    """)
+
+
+def m003_moonshot_columns(cur):
+    _add_columns(cur, 'tokens', [
+        ("mentions_5m", "INTEGER DEFAULT 0"),
+        ("mentions_15m", "INTEGER DEFAULT 0"),
+        ("mentions_1h", "INTEGER DEFAULT 0"),
+        ("velocity_score", "NUMERIC DEFAULT 0"),
+        ("moonshot_score", "NUMERIC DEFAULT 0"),
+        ("is_gold", "BOOLEAN DEFAULT FALSE"),
+        ("trader_notes", "TEXT"),
+    ])
+
+
+def m004_messages_and_channels(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.messages (
+            id SERIAL PRIMARY KEY,
+            channel_id TEXT,
+            sender_id TEXT,
+            text TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.target_channels (
+            id SERIAL PRIMARY KEY,
+            identifier TEXT UNIQUE,
+            name TEXT,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def m005_raw_response(cur):
+    _add_columns(cur, 'tokens', [("raw_response", "TEXT")])
+
+
+def m006_wallet_cursors(cur):
+    _add_columns(cur, 'holders_analysis', [
+        ("last_signature", "TEXT"),
+        ("first_tx_at", "TIMESTAMP"),
+        ("tx_count", "INTEGER DEFAULT 0"),
+        ("buy_count", "INTEGER DEFAULT 0"),
+        ("sell_count", "INTEGER DEFAULT 0"),
+        ("sol_in", "NUMERIC DEFAULT 0"),
+        ("sol_out", "NUMERIC DEFAULT 0"),
+        ("positions", "JSON"),
+    ])
+
+
+def m007_hot_path_indexes(cur):
+    # Runs outside a transaction so writers are never blocked while indexes build.
+    # The messages and token_mentions indexes are built by m008 on the partitioned parents.
+    _create_index_concurrently(cur, 'ix_tokens_score', 'tokens (moonshot_score DESC)')
+    _create_index_concurrently(cur, 'ix_tokens_created_at', 'tokens (created_at DESC)')
+    _create_index_concurrently(cur, 'ix_tokens_gold', 'tokens (created_at DESC) WHERE is_gold')
+
+
+def m008_partition_by_time(cur):
+    for table in PARTITIONED_TABLES:
+        _convert_to_partitioned(cur, table)
+
+
+def m009_work_queue(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.work_items (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            shard INTEGER,
+            payload JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS ix_work_items_shard_id ON {SCHEMA}.work_items (shard, id);")
+    # One NOTIFY per INSERT statement wakes idle consumers without polling
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {SCHEMA}.notify_work_items() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('work_items', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute(f"DROP TRIGGER IF EXISTS work_items_notify ON {SCHEMA}.work_items;")
+    cur.execute(f"""
+        CREATE TRIGGER work_items_notify AFTER INSERT ON {SCHEMA}.work_items
+        FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.notify_work_items();
+    """)
+
+
+def m010_channel_peer_cache(cur):
+    _add_columns(cur, 'target_channels', [
+        ("peer_id", "BIGINT"),
+        ("access_hash", "BIGINT"),
+        ("resolved_at", "TIMESTAMP"),
+    ])
+
+
+def m011_token_holders(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.token_holders (
+            contract_address TEXT NOT NULL,
+            wallet_address TEXT NOT NULL,
+            rank INTEGER,
+            percent NUMERIC,
+            seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (contract_address, wallet_address)
+        );
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS ix_token_holders_wallet ON {SCHEMA}.token_holders (wallet_address);")
+    _add_columns(cur, 'tokens', [("smart_money_ratio", "NUMERIC")])
+
+
+def m012_backfill_cursors(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.backfill_cursors (
+            source TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            last_message_id BIGINT,
+            last_timestamp TIMESTAMP,
+            messages_done BIGINT DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, channel)
+        );
+    """)
+
+
+def m013_compact_mention_keys(cur):
+    # Every mentioned CA gets a tokens row, so mentions can reference tokens.id
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.tokens (contract_address)
+        SELECT DISTINCT contract_address FROM {SCHEMA}.token_mentions WHERE contract_address IS NOT NULL
+        ON CONFLICT (contract_address) DO NOTHING;
+    """)
+    _add_columns(cur, 'token_mentions', [("token_id", "INTEGER"), ("channel_id", "BIGINT")])
+    cur.execute(f"""
+        UPDATE {SCHEMA}.token_mentions m
+        SET token_id = t.id, channel_id = {_to_bigint('m.source_channel')}
+        FROM {SCHEMA}.tokens t
+        WHERE t.contract_address = m.contract_address;
+    """)
+    # Drops ix_token_mentions_ca_ts along with the column
+    cur.execute(f"ALTER TABLE {SCHEMA}.token_mentions DROP COLUMN contract_address, DROP COLUMN source_channel;")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS ix_token_mentions_token_ts ON {SCHEMA}.token_mentions (token_id, timestamp);")
+    for column in ('channel_id', 'sender_id'):
+        cur.execute(f"ALTER TABLE {SCHEMA}.messages ALTER COLUMN {column} TYPE BIGINT USING {_to_bigint(column)};")
+
+
+def m014_token_audits(cur):
+    from audits import pack
+
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.token_audits (
+            id BIGSERIAL PRIMARY KEY,
+            token_id INTEGER NOT NULL,
+            raw BYTEA NOT NULL,
+            raw_size INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS ix_token_audits_token ON {SCHEMA}.token_audits (token_id, id DESC);")
+    _add_columns(cur, 'tokens', [("latest_audit_id", "BIGINT")])
+
+    # Each stored raw_response becomes its token's first audit (compressed client-side)
+    read = cur.connection.cursor(name='m014_raw_responses')
+    read.itersize = 1000
+    read.execute(f"SELECT id, raw_response, created_at FROM {SCHEMA}.tokens WHERE raw_response IS NOT NULL;")
+    while True:
+        rows = read.fetchmany(1000)
+        if not rows:
+            break
+        execute_values(cur, f"INSERT INTO {SCHEMA}.token_audits (token_id, raw, raw_size, created_at) VALUES %s", [
+            (token_id, psycopg2.Binary(pack(text)), len(text.encode()), created_at or datetime.utcnow())
+            for token_id, text, created_at in rows
+        ])
+    read.close()
+    cur.execute(f"""
+        UPDATE {SCHEMA}.tokens t SET latest_audit_id = a.id
+        FROM {SCHEMA}.token_audits a WHERE a.token_id = t.id;
+    """)
+    cur.execute(f"ALTER TABLE {SCHEMA}.tokens DROP COLUMN raw_response;")
+
+
+def m015_mention_rollups(cur):
+    # channel_id 0 stands for an unknown channel (it is part of the key)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.token_mention_rollups (
+            token_id INTEGER NOT NULL,
+            bucket_start TIMESTAMP NOT NULL,
+            bucket_seconds INTEGER NOT NULL,
+            channel_id BIGINT NOT NULL DEFAULT 0,
+            mentions INTEGER NOT NULL,
+            PRIMARY KEY (token_id, bucket_start, bucket_seconds, channel_id)
+        );
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS ix_mention_rollups_bucket ON {SCHEMA}.token_mention_rollups (bucket_start);")
+    # What history and velocity queries read: raw rows (bucket_seconds 0) plus rollups
+    cur.execute(f"""
+        CREATE OR REPLACE VIEW {SCHEMA}.token_mention_history AS
+        SELECT token_id, channel_id, timestamp AS bucket_start, 0 AS bucket_seconds, 1 AS mentions
+        FROM {SCHEMA}.token_mentions
+        UNION ALL
+        SELECT token_id, NULLIF(channel_id, 0), bucket_start, bucket_seconds, mentions
+        FROM {SCHEMA}.token_mention_rollups;
+    """)
+
+
+def m016_leaderboard(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.leaderboard (
+            token_id INTEGER PRIMARY KEY,
+            score_rank INTEGER,
+            gold_rank INTEGER,
+            latest_rank INTEGER,
+            is_gold BOOLEAN,
+            symbol VARCHAR,
+            contract_address VARCHAR,
+            mentions_5m INTEGER,
+            score_text VARCHAR,
+            score_label VARCHAR,
+            mentions_label VARCHAR,
+            fdv_label VARCHAR,
+            liquidity_label VARCHAR,
+            risk VARCHAR,
+            audit_status VARCHAR,
+            trader_notes TEXT,
+            refreshed_at TIMESTAMP
+        );
+    """)
+    for column in ('score_rank', 'gold_rank', 'latest_rank'):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS ix_leaderboard_{column} ON {SCHEMA}.leaderboard ({column});")
+
+
+def m017_wallet_resume_cursor(cur):
+    _add_columns(cur, 'holders_analysis', [("resume_before", "TEXT"), ("resume_until", "TEXT")])
+
+
+# (version, description, function, transactional)
+MIGRATIONS = [
+    (1, "create bot_schema and search_path", m001_schema, True),
+    (2, "base tables", m002_base_tables, True),
+    (3, "moonshot metric columns on tokens", m003_moonshot_columns, True),
+    (4, "messages and target_channels", m004_messages_and_channels, True),
+    (5, "tokens.raw_response", m005_raw_response, True),
+    (6, "wallet history cursor columns", m006_wallet_cursors, True),
+    (7, "hot path indexes", m007_hot_path_indexes, False),
+    (8, "daily range partitions for messages and token_mentions", m008_partition_by_time, True),
+    (9, "work_items queue with NOTIFY trigger", m009_work_queue, True),
+    (10, "cached peer id and access hash on target_channels", m010_channel_peer_cache, True),
+    (11, "token_holders and tokens.smart_money_ratio", m011_token_holders, True),
+    (12, "backfill_cursors", m012_backfill_cursors, True),
+    (13, "token_mentions by tokens.id; BIGINT peer ids", m013_compact_mention_keys, True),
+    (14, "compressed token_audits replace tokens.raw_response", m014_token_audits, True),
+    (15, "token_mention_rollups and token_mention_history view", m015_mention_rollups, True),
+    (16, "precomputed leaderboard snapshot", m016_leaderboard, True),
+    (17, "holders_analysis resume cursor for capped history reads", m017_wallet_resume_cursor, True),
+]
+
+
+# --- Helpers ----------------------------------------------------------------
+
+def _add_columns(cur, table, columns):
+    for col_name, col_type in columns:
+        cur.execute(f"ALTER TABLE {SCHEMA}.{table} ADD COLUMN IF NOT EXISTS {col_name} {col_type};")
+
+
+def _to_bigint(column):
+    # Rows written as str(None) or from non-numeric ids become NULL
+    return f"CASE WHEN {column} ~ '^-?[0-9]+$' THEN {column}::bigint END"
+
+
+def _create_index_concurrently(cur, name, definition):
+    # A previously interrupted CONCURRENTLY build leaves an INVALID index behind; rebuild it
+    cur.execute("""
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (SCHEMA, name))
+    row = cur.fetchone()
+    if row and not row[0]:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{name};")
+    cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {SCHEMA}.{definition};")
+
+
+def _is_partitioned(cur, table):
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (SCHEMA, table))
+    row = cur.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _convert_to_partitioned(cur, table):
+    """
+    Rebuilds `table` as a RANGE(timestamp) partitioned table with daily partitions,
+    keeping its rows, id sequence and hot-path indexes.
+    """
+    if _is_partitioned(cur, table):
+        return
+    new = f"{table}_partitioned"
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.{new} (LIKE {SCHEMA}.{table} INCLUDING DEFAULTS)
+        PARTITION BY RANGE (timestamp);
+    """)
+    # The partition key must be part of the primary key
+    cur.execute(f"ALTER TABLE {SCHEMA}.{new} ALTER COLUMN timestamp SET NOT NULL;")
+    cur.execute(f"ALTER TABLE {SCHEMA}.{new} ALTER COLUMN timestamp SET DEFAULT CURRENT_TIMESTAMP;")
+    cur.execute(f"ALTER TABLE {SCHEMA}.{new} ADD PRIMARY KEY (id, timestamp);")
+    cur.execute(f"CREATE TABLE {SCHEMA}.{table}_default PARTITION OF {SCHEMA}.{new} DEFAULT;")
+
+    # Writers wait until the rename commits; otherwise rows they commit after the
+    # copy's snapshot would stay behind in the old table and be dropped with it
+    cur.execute(f"LOCK TABLE {SCHEMA}.{table} IN EXCLUSIVE MODE;")
+    cur.execute(f"UPDATE {SCHEMA}.{table} SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL;")
+    cur.execute(f"SELECT min(timestamp)::date FROM {SCHEMA}.{table};")
+    first_day = cur.fetchone()[0] or date.today()
+    _ensure_partitions(cur, table, first_day, (date.today() - first_day).days + PARTITION_DAYS_AHEAD, parent=new)
+
+    # LIKE keeps the column order, so a plain SELECT * lines up
+    cur.execute(f"INSERT INTO {SCHEMA}.{new} SELECT * FROM {SCHEMA}.{table};")
+    cur.execute(f"ALTER TABLE {SCHEMA}.{table} RENAME TO {table}_unpartitioned;")
+    cur.execute(f"ALTER TABLE {SCHEMA}.{new} RENAME TO {table};")
+    cur.execute(f"ALTER SEQUENCE {SCHEMA}.{table}_id_seq OWNED BY {SCHEMA}.{table}.id;")
+    cur.execute(f"DROP TABLE {SCHEMA}.{table}_unpartitioned;")
+
+    # Partitioned parents can't build indexes CONCURRENTLY; the table was just rebuilt anyway
+    if table == 'token_mentions':
+        cur.execute(f"CREATE INDEX IF NOT EXISTS ix_token_mentions_ca_ts ON {SCHEMA}.token_mentions (contract_address, timestamp);")
+    elif table == 'messages':
+        cur.execute(f"CREATE INDEX IF NOT EXISTS ix_messages_ts ON {SCHEMA}.messages (timestamp DESC);")
+
+
+def _partition_name(table, day):
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def _ensure_partitions(cur, table, start, days, parent=None):
+    parent = parent or table
+    for i in range(days + 1):
+        day = start + timedelta(days=i)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA}.{_partition_name(table, day)}
+            PARTITION OF {SCHEMA}.{parent}
+            FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}');
+        """)
+
+
+def _list_partitions(cur, table):
+    """
+    Returns [(partition name, day)] for the daily partitions of table, oldest first.
+    """
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = %s AND p.relname = %s
+    """, (SCHEMA, table))
+    prefix = f"{table}_p"
+    parts = []
+    for (name,) in cur.fetchall():
+        if name.startswith(prefix):
+            try:
+                parts.append((name, datetime.strptime(name[len(prefix):], '%Y%m%d').date()))
+            except ValueError:
+                continue
+    return sorted(parts, key=lambda p: p[1])
+
+
+def drop_partitions_before(cur, table, cutoff):
+    """
+    Retention: detaches and drops whole daily partitions older than cutoff.
+    """
+    dropped = []
+    for name, day in _list_partitions(cur, table):
+        if day >= cutoff:
+            break
+        cur.execute(f"ALTER TABLE {SCHEMA}.{table} DETACH PARTITION {SCHEMA}.{name};")
+        cur.execute(f"DROP TABLE {SCHEMA}.{name};")
+        dropped.append(name)
+    return dropped
+
+
+# --- Compaction -------------------------------------------------------------
+
+_ROLLUP_UPSERT = f"""
+    ON CONFLICT (token_id, bucket_start, bucket_seconds, channel_id)
+    DO UPDATE SET mentions = {SCHEMA}.token_mention_rollups.mentions + EXCLUDED.mentions
+"""
+_ROLL_RAW = f"""
+    INSERT INTO {SCHEMA}.token_mention_rollups (token_id, bucket_start, bucket_seconds, channel_id, mentions)
+    SELECT token_id, date_trunc('minute', timestamp), 60, COALESCE(channel_id, 0), count(*)
+    FROM {{source}} WHERE token_id IS NOT NULL
+    GROUP BY 1, 2, 4
+""" + _ROLLUP_UPSERT
+
+
+def _roll_partition(cur, name):
+    # A whole day: read it once and drop it instead of deleting row by row
+    cur.execute(_ROLL_RAW.format(source=f"{SCHEMA}.{name}"))
+    written = cur.rowcount
+    cur.execute(f"ALTER TABLE {SCHEMA}.token_mentions DETACH PARTITION {SCHEMA}.{name};")
+    cur.execute(f"DROP TABLE {SCHEMA}.{name};")
+    return written
+
+
+def compact_mentions(now=None):
+    """
+    Rolls token_mentions older than RAW_MENTIONS_SECONDS into per-minute
+    (token, channel) buckets and minute buckets older than MINUTE_ROLLUP_SECONDS
+    into hourly ones, each step removing what it rolled up in the same transaction.
+    Readers see the sum through the token_mention_history view.
+    Returns the number of (minute, hourly) bucket rows written.
+    """
+    now = now or datetime.utcnow()
+    raw_cutoff = (now - timedelta(seconds=RAW_MENTIONS_SECONDS)).replace(second=0, microsecond=0)
+    minute_cutoff = (now - timedelta(seconds=MINUTE_ROLLUP_SECONDS)).replace(minute=0, second=0, microsecond=0)
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(%s);", (_COMPACT_LOCK_KEY,))
+    if not cur.fetchone()[0]:
+        cur.close()
+        conn.close()
+        return 0, 0
+    conn.autocommit = False
+    try:
+        minute_rows = 0
+        if _is_partitioned(cur, 'token_mentions'):
+            for name, day in _list_partitions(cur, 'token_mentions'):
+                if day + timedelta(days=1) > raw_cutoff.date():
+                    break
+                minute_rows += _roll_partition(cur, name)
+                # DETACH locks token_mentions until commit; keep that short
+                conn.commit()
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {SCHEMA}.token_mentions WHERE timestamp < %(cutoff)s
+                RETURNING token_id, channel_id, timestamp
+            )
+        """ + _ROLL_RAW.format(source="moved"), {"cutoff": raw_cutoff})
+        minute_rows += cur.rowcount
+        conn.commit()
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {SCHEMA}.token_mention_rollups
+                WHERE bucket_seconds = 60 AND bucket_start < %(cutoff)s
+                RETURNING token_id, bucket_start, channel_id, mentions
+            )
+            INSERT INTO {SCHEMA}.token_mention_rollups (token_id, bucket_start, bucket_seconds, channel_id, mentions)
+            SELECT token_id, date_trunc('hour', bucket_start), 3600, channel_id, sum(mentions)
+            FROM moved GROUP BY 1, 2, 4
+        """ + _ROLLUP_UPSERT, {"cutoff": minute_cutoff})
+        hour_rows = cur.rowcount
+        conn.commit()
+        return minute_rows, hour_rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+        cur.execute("SELECT pg_advisory_unlock(%s);", (_COMPACT_LOCK_KEY,))
+        cur.close()
+        conn.close()
+
+
+# --- Runner -----------------------------------------------------------------
+
+def _connect():
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = True
+    return conn
+
+
+def _applied_versions(cur):
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA};")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute(f"SELECT version FROM {SCHEMA}.schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def upgrade():
+    """
+    Applies every migration newer than the recorded version, in order.
+    """
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s);", (_LOCK_KEY,))
+        applied = _applied_versions(cur)
+        for version, description, func, transactional in MIGRATIONS:
+            if version in applied:
+                continue
+            print(f"Applying migration {version}: {description}...")
+            if transactional:
+                conn.autocommit = False
+            try:
+                func(cur)
+                cur.execute(f"INSERT INTO {SCHEMA}.schema_migrations (version, description) VALUES (%s, %s);",
+                            (version, description))
+                if transactional:
+                    conn.commit()
+            except Exception:
+                if transactional:
+                    conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+        print("Database schema is up to date.")
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s);", (_LOCK_KEY,))
+        cur.close()
+        conn.close()
+
+
+def status():
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        applied = _applied_versions(cur)
+        for version, description, _, _ in MIGRATIONS:
+            mark = "x" if version in applied else " "
+            print(f"[{mark}] {version:03d} {description}")
+    finally:
+        cur.close()
+        conn.close()
+
+
+def ensure_partitions_between(start, end):
+    """
+    Creates the daily partitions covering [start, end] so bulk loads of past
+    days land in their own partition rather than the default one.
+    Days whose rows already sit in the default partition are left there.
+    """
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        for table in PARTITIONED_TABLES:
+            if not _is_partitioned(cur, table):
+                continue
+            for i in range((end - start).days + 1):
+                try:
+                    _ensure_partitions(cur, table, start + timedelta(days=i), 0)
+                except psycopg2.Error as e:
+                    print(f"Keeping {table} rows of {start + timedelta(days=i)} in the default partition: {e}")
+    finally:
+        cur.close()
+        conn.close()
+
+
+def maintain():
+    """
+    Creates upcoming daily partitions and drops the ones past retention.
+    """
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        today = date.today()
+        for table in PARTITIONED_TABLES:
+            if not _is_partitioned(cur, table):
+                continue
+            _ensure_partitions(cur, table, today, PARTITION_DAYS_AHEAD)
+            keep_days = RETENTION_DAYS.get(table, 0)
+            if keep_days:
+                dropped = drop_partitions_before(cur, table, today - timedelta(days=keep_days))
+                if dropped:
+                    print(f"Dropped {len(dropped)} expired partitions of {table}.")
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    try:
+        {"upgrade": upgrade, "status": status, "maintain": maintain, "compact": compact_mentions}[command]()
+    except KeyError:
+        print("Usage: python migrations.py [upgrade|status|maintain|compact]")
+        sys.exit(2)
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        sys.exit(1)
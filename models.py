@@ -1,8 +1,10 @@
 import os
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Numeric, DateTime, ForeignKey, Boolean, Text, JSON, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -11,14 +13,46 @@ load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Pool for the async engine used by the worker's hot path (handlers, writer, work queue).
+# The sync engine above stays for the dashboard, migrations and batch jobs.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+_ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+def async_url(url):
+    """
+    The same database URL with its async driver (asyncpg for Postgres).
+    """
+    url = make_url(url)
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def _async_engine_options(url):
+    if url.get_backend_name() != 'postgresql':
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+_async_url = async_url(DATABASE_URL)
+async_engine = create_async_engine(_async_url, **_async_engine_options(_async_url))
+# One session per task or unit of work; never shared between tasks
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class Message(Base):
     __tablename__ = 'messages'
     __table_args__ = {'schema': 'bot_schema'}
     id = Column(Integer, primary_key=True)
-    channel_id = Column(String)
-    sender_id = Column(String)
+    channel_id = Column(BigInteger) # Telegram peer id
+    sender_id = Column(BigInteger)
     text = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
@@ -30,6 +64,10 @@ class TargetChannel(Base):
     name = Column(String)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Resolved once by the worker so restarts don't refetch the entity
+    peer_id = Column(BigInteger)
+    access_hash = Column(BigInteger)
+    resolved_at = Column(DateTime)
 
 class Token(Base):
     __tablename__ = 'tokens'
@@ -43,6 +81,7 @@ class Token(Base):
     liquidity = Column(Numeric)
     volume_24h = Column(Numeric)
     top_holders_percent = Column(Numeric)
+    smart_money_ratio = Column(Numeric) # Share of profiled top holders that are smart money
     rick_score = Column(Integer)
     audit_status = Column(String)
     pump_prob = Column(Numeric)
@@ -58,7 +97,7 @@ class Token(Base):
     is_gold = Column(Boolean, default=False)
     
     trader_notes = Column(Text)
-    raw_response = Column(Text) # Store full Rick Bot response
+    latest_audit_id = Column(BigInteger) # token_audits.id of the newest Rick Bot response
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class HolderAnalysis(Base):
@@ -71,16 +110,101 @@ class HolderAnalysis(Base):
     win_rate = Column(Numeric)
     last_updated = Column(DateTime, default=datetime.utcnow)
 
+    # Incremental history state (see analysis.WalletAggregator)
+    last_signature = Column(String) # Newest transaction already aggregated
+    resume_before = Column(String) # Unread gap left by a capped refresh: older than this...
+    resume_until = Column(String) # ...and newer than this (NULL = the wallet's first transaction)
+    first_tx_at = Column(DateTime)
+    tx_count = Column(Integer, default=0)
+    buy_count = Column(Integer, default=0)
+    sell_count = Column(Integer, default=0)
+    sol_in = Column(Numeric, default=0) # lamports
+    sol_out = Column(Numeric, default=0) # lamports
+    positions = Column(JSON) # {mint: [lamports spent, lamports received]}
+
+class TokenHolder(Base):
+    __tablename__ = 'token_holders'
+    __table_args__ = {'schema': 'bot_schema'}
+    contract_address = Column(String, primary_key=True)
+    wallet_address = Column(String, primary_key=True, index=True)
+    rank = Column(Integer) # Position in Rick Bot's top-holder list
+    percent = Column(Numeric)
+    seen_at = Column(DateTime, default=datetime.utcnow)
+
 class TokenMention(Base):
     __tablename__ = 'token_mentions'
     __table_args__ = {'schema': 'bot_schema'}
     id = Column(Integer, primary_key=True)
-    contract_address = Column(String, index=True)
-    source_channel = Column(String)
+    token_id = Column(Integer, index=True) # tokens.id
+    channel_id = Column(BigInteger) # Telegram peer id
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+class TokenMentionRollup(Base):
+    # token_mentions past migrations.RAW_MENTIONS_SECONDS, counted per minute and later per hour
+    __tablename__ = 'token_mention_rollups'
+    __table_args__ = {'schema': 'bot_schema'}
+    token_id = Column(Integer, primary_key=True) # tokens.id
+    bucket_start = Column(DateTime, primary_key=True, index=True)
+    bucket_seconds = Column(Integer, primary_key=True) # 60 or 3600
+    channel_id = Column(BigInteger, primary_key=True, default=0) # 0 = unknown channel
+    mentions = Column(Integer, nullable=False)
+
+class TokenAudit(Base):
+    __tablename__ = 'token_audits'
+    __table_args__ = {'schema': 'bot_schema'}
+    # Increases with every audit, so it orders a token's versions (INTEGER on SQLite, which only autoincrements that)
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    token_id = Column(Integer, nullable=False, index=True) # tokens.id
+    raw = Column(LargeBinary, nullable=False) # Full Rick Bot response, see audits.pack
+    raw_size = Column(Integer) # Uncompressed bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class LeaderboardEntry(Base):
+    # Snapshot rebuilt by leaderboard.refresh_leaderboard; the dashboard reads only this
+    __tablename__ = 'leaderboard'
+    __table_args__ = {'schema': 'bot_schema'}
+    token_id = Column(Integer, primary_key=True) # tokens.id
+    score_rank = Column(Integer, index=True) # 1 = highest moonshot_score, NULL past LEADERBOARD_SIZE
+    gold_rank = Column(Integer, index=True) # Newest gold tokens first
+    latest_rank = Column(Integer, index=True) # Newest tokens first
+    is_gold = Column(Boolean)
+    symbol = Column(String)
+    contract_address = Column(String)
+    mentions_5m = Column(Integer)
+    # Pre-formatted display fields (see leaderboard.display_fields)
+    score_text = Column(String)
+    score_label = Column(String)
+    mentions_label = Column(String)
+    fdv_label = Column(String)
+    liquidity_label = Column(String)
+    risk = Column(String)
+    audit_status = Column(String)
+    trader_notes = Column(Text)
+    refreshed_at = Column(DateTime)
+
+class BackfillCursor(Base):
+    __tablename__ = 'backfill_cursors'
+    __table_args__ = {'schema': 'bot_schema'}
+    source = Column(String, primary_key=True) # 'telegram' (channel history) or 'replay' (stored messages)
+    channel = Column(String, primary_key=True) # Peer id, or '*' for a replay of every channel
+    last_message_id = Column(BigInteger) # Telegram message id, or messages.id for replays
+    last_timestamp = Column(DateTime)
+    messages_done = Column(BigInteger, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class WorkItem(Base):
+    __tablename__ = 'work_items'
+    __table_args__ = {'schema': 'bot_schema'}
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False) # 'message', 'mention', 'rick_reply', 'rick_request'
+    shard = Column(Integer) # NULL = any analysis worker
+    payload = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    # Schema is owned by the versioned migration runner (see migrations.py)
+    from migrations import upgrade
+    upgrade()
 
 if __name__ == "__main__":
     init_db()
@@ -1,56 +1,131 @@
 import re
-from models import SessionLocal, Token, TokenMention
-from datetime import datetime
 
-# Regex for CA (Solana: 32-44 alphanumeric, EVM: 0x...)
+# Regex for CA (Solana: 32-44 base58 chars, EVM: 0x + 40 hex). Addresses must not be glued
+# to other alphanumerics, so we never return a slice of a longer word or URL token.
 SOLANA_CA_REGEX = r'[1-9A-HJ-NP-Za-km-z]{32,44}'
 EVM_CA_REGEX = r'0x[a-fA-F0-9]{40}'
+_CA = rf'(?<![0-9A-Za-z])(?:(?P<evm>{EVM_CA_REGEX})|(?P<sol>{SOLANA_CA_REGEX}))(?![0-9A-Za-z])'
+CA_PATTERN = re.compile(_CA)
+
+# Rick Bot fields, scanned together with CAs in a single pass over the response
+# The unit must follow the number directly and end the word ("$350 Bought" is not billions)
+_AMOUNT = r'(\d[\d,]*(?:\.\d+)?)([KMB](?![A-Za-z]))?'
+RICK_PATTERN = re.compile(
+    rf'FDV:\s*\$(?P<fdv>{_AMOUNT})'
+    rf'|Liq:\s*\$(?P<liq>{_AMOUNT})'
+    r'|(?<=\s)\$(?P<symbol>[A-Z][A-Z0-9]*)\b'
+    rf'|{_CA}'
+)
+_FDV_NUM, _FDV_UNIT = RICK_PATTERN.groupindex['fdv'] + 1, RICK_PATTERN.groupindex['fdv'] + 2
+_LIQ_NUM, _LIQ_UNIT = RICK_PATTERN.groupindex['liq'] + 1, RICK_PATTERN.groupindex['liq'] + 2
+
+# Explorer account links Rick Bot puts behind each top-holder percentage
+HOLDER_LINK_PATTERN = re.compile(
+    r'(?:solscan\.io/account|solana\.fm/address|explorer\.solana\.com/address|birdeye\.so/profile|gmgn\.ai/sol/address)'
+    rf'/(?P<wallet>{SOLANA_CA_REGEX})(?![0-9A-Za-z])'
+)
+_TOP_HOLDERS_LINE = re.compile(r'TH:\s*([^\n\[]*)')
+_PERCENT = re.compile(r'\d+(?:\.\d+)?')
+
+_MULTIPLIERS = {None: 1, 'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+
+_BASE58_INDEX = {c: i for i, c in enumerate('123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz')}
+
+
+def is_valid_solana_address(candidate):
+    """
+    True if candidate base58-decodes to a 32-byte public key.
+    Filters out tickers, hashes and words that merely look like base58.
+    """
+    n = 0
+    for ch in candidate:
+        n = n * 58 + _BASE58_INDEX[ch]
+    leading_zeros = len(candidate) - len(candidate.lstrip('1'))
+    return leading_zeros + (n.bit_length() + 7) // 8 == 32
+
+
+def _match_ca(m):
+    evm = m.group('evm')
+    if evm:
+        return evm, "evm"
+    sol = m.group('sol')
+    if sol and is_valid_solana_address(sol):
+        return sol, "solana"
+    return None, None
+
+
+def parse_amount(number, unit=None):
+    """
+    '3.5', 'K' -> 3500.0 ; '1,250,000', None -> 1250000.0
+    """
+    return float(number.replace(',', '')) * _MULTIPLIERS[unit]
+
+
+def extract_cas(text):
+    """
+    Returns every contract address in text as (ca, chain) pairs, in order of appearance, without duplicates.
+    """
+    found = []
+    seen = set()
+    for m in CA_PATTERN.finditer(text):
+        ca, chain = _match_ca(m)
+        if ca and ca not in seen:
+            seen.add(ca)
+            found.append((ca, chain))
+    return found
+
 
 def extract_ca(text):
-    sol_match = re.search(SOLANA_CA_REGEX, text)
-    if sol_match:
-        return sol_match.group(0), "solana"
-    
-    evm_match = re.search(EVM_CA_REGEX, text)
-    if evm_match:
-        return evm_match.group(0), "evm"
-    
+    """
+    Returns the first contract address in text and its chain, or (None, None).
+    """
+    for m in CA_PATTERN.finditer(text):
+        ca, chain = _match_ca(m)
+        if ca:
+            return ca, chain
     return None, None
 
+
 def parse_rick_bot_response(text):
     """
     Parses emojis and metrics from Rick Bot's response.
     Example input: 💊 Chinese Communist Dr.. [3.5K/7%] $FENTANYL ... 💎 FDV: $3.5K ...
     """
-    # This is a complex parser that needs to be robust against message changes.
+    # Single pass: the first occurrence of each field wins.
     data = {}
-    
-    # Extract FDV
-    fdv_match = re.search(r'FDV:\s*\$([\d\.MK]+)', text)
-    if fdv_match:
-        val = fdv_match.group(1)
-        if 'K' in val: data['fdv'] = float(val.replace('K', '')) * 1000
-        elif 'M' in val: data['fdv'] = float(val.replace('M', '')) * 1000000
-        else: data['fdv'] = float(val)
-
-    # Extract Liquidity
-    liq_match = re.search(r'Liq:\s*\$([\d\.MK]+)', text)
-    if liq_match:
-        val = liq_match.group(1)
-        if 'K' in val: data['liquidity'] = float(val.replace('K', '')) * 1000
-        elif 'M' in val: data['liquidity'] = float(val.replace('M', '')) * 1000000
-        else: data['liquidity'] = float(val)
-
-    # Extract Symbol/Name
-    symbol_match = re.search(r'\s\$([A-Z0-9]+)', text)
-    if symbol_match:
-        data['symbol'] = symbol_match.group(1)
-
-    # Extract Top Holders Wallet Links (dummy example)
-    # Rick bot usually provides a link or a summary of TH. 
-    # For now, we extract the CA at the bottom of the response if provided.
-    ca_match = re.search(SOLANA_CA_REGEX, text)
-    if ca_match:
-        data['contract_address'] = ca_match.group(0)
-
+    for m in RICK_PATTERN.finditer(text):
+        kind = m.lastgroup
+        if kind == 'fdv':
+            if 'fdv' not in data:
+                data['fdv'] = parse_amount(m.group(_FDV_NUM), m.group(_FDV_UNIT))
+        elif kind == 'liq':
+            if 'liquidity' not in data:
+                data['liquidity'] = parse_amount(m.group(_LIQ_NUM), m.group(_LIQ_UNIT))
+        elif kind == 'symbol':
+            data.setdefault('symbol', m.group('symbol'))
+        elif 'contract_address' not in data:
+            ca, chain = _match_ca(m)
+            if ca:
+                data['contract_address'] = ca
+                data['platform'] = chain
     return data
+
+
+def extract_holder_wallets(text, links=(), exclude=()):
+    """
+    Returns the top-holder wallets of a Rick Bot audit as (wallet, percent) pairs in rank order.
+    Wallets come from explorer account links: the URLs of the message's link entities
+    (which the plain text does not carry) followed by any written out in the text.
+    Percentages are read from the "TH:" line; percent is None when there are more wallets.
+    """
+    m = _TOP_HOLDERS_LINE.search(text)
+    percents = [float(p) for p in _PERCENT.findall(m.group(1))] if m else []
+    wallets = []
+    seen = set(exclude)
+    for source in (*links, text):
+        for w in HOLDER_LINK_PATTERN.finditer(source):
+            wallet = w.group('wallet')
+            if wallet not in seen and is_valid_solana_address(wallet):
+                seen.add(wallet)
+                wallets.append(wallet)
+    return [(w, percents[i] if i < len(percents) else None) for i, w in enumerate(wallets)]
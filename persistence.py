@@ -0,0 +1,247 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from sqlalchemy import insert
+from models import AsyncSessionLocal, Message, TokenMention, WorkItem
+from repository import upsert_and_score, mention_rows, append_audits, token_ids
+import metrics
+
+WRITE_QUEUE_MAX = int(os.getenv('WRITE_QUEUE_MAX', '10000'))
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '500'))
+WRITE_FLUSH_INTERVAL = float(os.getenv('WRITE_FLUSH_INTERVAL', '0.5'))
+# A failed batch is retried this many times (with doubling delays) before it is dropped
+WRITE_FLUSH_RETRIES = int(os.getenv('WRITE_FLUSH_RETRIES', '3'))
+WRITE_RETRY_DELAY = float(os.getenv('WRITE_RETRY_DELAY', '0.5'))
+
+_queue_depth = metrics.gauge('write_queue_depth', 'Pending rows in the write-behind queue')
+_flush_latency = metrics.histogram('write_flush_seconds', 'Time spent flushing one batch')
+_rows_flushed = metrics.counter('write_rows_flushed_total', 'Rows written by the write-behind queue')
+_flush_errors = metrics.counter('write_flush_errors_total', 'Batches that failed to flush')
+_flush_retries = metrics.counter('write_flush_retries_total', 'Flush attempts retried after an error')
+_scored_errors = metrics.counter('write_on_scored_errors_total', 'Written batches whose on_scored callback failed')
+
+_STOP = object()
+
+
+def _split(batch):
+    # (messages, mentions, tokens, work, CAs queued with audit=True, audits)
+    messages, mentions, tokens, work, audit, audits = [], [], [], [], [], []
+    for kind, row in batch:
+        if kind == 'message':
+            messages.append(row)
+        elif kind == 'mention':
+            mentions.append(row)
+        elif kind == 'audit':
+            audits.append(row)
+        elif kind == 'work':
+            work.append(row)
+        else:
+            tokens.append(row)
+            if kind == 'token_audit':
+                audit.append(row['contract_address'])
+    return messages, mentions, tokens, work, audit, audits
+
+
+class WriteBehindWriter:
+    """
+    Buffers Message/TokenMention/Token writes from the Telegram handlers and
+    flushes them in batches from a background task, so handlers never wait
+    on a Postgres commit.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, max_queue=WRITE_QUEUE_MAX,
+                 batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL,
+                 retries=WRITE_FLUSH_RETRIES, retry_delay=WRITE_RETRY_DELAY):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # async callback given {ca: score} for the tokens of a flushed batch queued with audit=True.
+        # It must not queue into this writer: the writer task itself awaits it.
+        self.on_scored = None
+        # Batches dropped after their last retry; callers compare it around drain()
+        self.failed_flushes = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def _put(self, item):
+        # Blocks the producer when the queue is full (backpressure)
+        await self.queue.put(item)
+        _queue_depth.set(self.queue.qsize())
+
+    async def add_message(self, channel_id, sender_id, text, timestamp=None):
+        await self._put(('message', {
+            "channel_id": channel_id,
+            "sender_id": sender_id,
+            "text": text,
+            "timestamp": timestamp or datetime.utcnow(),
+        }))
+
+    async def add_mention(self, ca, channel_id, timestamp=None):
+        # Resolved to tokens.id at flush time
+        await self._put(('mention', {
+            "contract_address": ca,
+            "channel_id": channel_id,
+            "timestamp": timestamp or datetime.utcnow(),
+        }))
+
+    async def add_audit(self, ca, text, timestamp=None):
+        # Kept in token_audits, compressed; the token row only points at the newest
+        await self._put(('audit', {
+            "contract_address": ca,
+            "text": text,
+            "created_at": timestamp or datetime.utcnow(),
+        }))
+
+    async def update_token(self, ca, fields, audit=False):
+        """
+        Queues an upsert of the given Token columns, keyed by contract_address.
+        The token is rescored from its merged state when the batch is flushed;
+        with audit=True its score is passed to on_scored afterwards.
+        """
+        await self._put(('token_audit' if audit else 'token', dict(fields, contract_address=ca)))
+
+    async def add_work(self, kind, payload, shard=None):
+        """
+        Queues a work item for another process (see workqueue.py).
+        """
+        await self._put(('work', {
+            "kind": kind,
+            "shard": shard,
+            "payload": payload,
+            "created_at": datetime.utcnow(),
+        }))
+
+    async def drain(self):
+        """
+        Waits until everything queued so far has been flushed.
+        """
+        await self.queue.join()
+
+    async def run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    self.queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            _queue_depth.set(self.queue.qsize())
+            if batch:
+                try:
+                    await self.flush(batch)
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+
+    def take(self):
+        """
+        Removes and returns everything queued so far, for a writer that is never
+        start()ed and whose rows go out through write_in().
+        """
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+            self.queue.task_done()
+        _queue_depth.set(self.queue.qsize())
+        return batch
+
+    async def write_in(self, db, batch):
+        """
+        Writes a taken batch in the caller's transaction, without committing.
+        Returns a coroutine function to await once db has committed.
+        """
+        messages, mentions, tokens, work, audit, audits = _split(batch)
+        ids = {}
+        scores = await self._write_rows(db, messages, mentions, tokens, work, audits, ids)
+
+        async def committed():
+            token_ids.update(ids)
+            _rows_flushed.inc(len(messages) + len(mentions) + len(scores) + len(work) + len(audits))
+            if audit and self.on_scored is not None:
+                await self.on_scored({ca: scores.get(ca) for ca in audit})
+        return committed
+
+    async def flush(self, batch):
+        messages, mentions, tokens, work, audit, audits = _split(batch)
+        started = time.perf_counter()
+        try:
+            # The batch is one transaction, so a failed attempt leaves nothing behind.
+            # Retrying matters most for work items: in ingest mode they are the only
+            # copy of the Telegram events.
+            for attempt in range(self.retries + 1):
+                try:
+                    scores = await self._write(messages, mentions, tokens, work, audits)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        self.failed_flushes += 1
+                        _flush_errors.inc()
+                        print(f"Error flushing write-behind batch ({len(batch)} rows), dropped: {e}")
+                        return
+                    _flush_retries.inc()
+                    delay = self.retry_delay * 2 ** attempt
+                    print(f"Error flushing write-behind batch ({len(batch)} rows), retrying in {delay:.1f}s: {e}")
+                    await asyncio.sleep(delay)
+            _rows_flushed.inc(len(messages) + len(mentions) + len(scores) + len(work) + len(audits))
+        finally:
+            _flush_latency.observe(time.perf_counter() - started)
+
+        if audit and self.on_scored is not None:
+            try:
+                await self.on_scored({ca: scores.get(ca) for ca in audit})
+            except Exception as e:
+                # The batch itself is written, so failed_flushes is left alone
+                _scored_errors.inc()
+                print(f"Error handling scored tokens: {e}")
+
+    async def _write(self, messages, mentions, tokens, work=(), audits=()):
+        ids = {}
+        async with self.session_factory() as db:
+            scores = await self._write_rows(db, messages, mentions, tokens, work, audits, ids)
+            await db.commit()
+        # Ids of tokens created by a rolled-back batch must never be cached
+        token_ids.update(ids)
+        return scores
+
+    async def _write_rows(self, db, messages, mentions, tokens, work, audits, ids):
+        if messages:
+            await db.execute(insert(Message.__table__), messages)
+        # Tokens first: their upsert returns the ids most mentions need
+        scores = await upsert_and_score(db, tokens, ids) if tokens else {}
+        if mentions:
+            await db.execute(insert(TokenMention.__table__), await mention_rows(db, mentions, ids))
+        if audits:
+            await append_audits(db, audits, ids)
+        if work:
+            await db.execute(insert(WorkItem.__table__), work)
+        return scores
+
+    async def close(self):
+        """
+        Flushes everything still queued and stops the writer task.
+        """
+        if self._task is None:
+            return
+        await self.queue.put(_STOP)
+        await self._task
+        self._task = None
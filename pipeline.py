@@ -0,0 +1,137 @@
+from datetime import datetime
+from parser import extract_cas, parse_rick_bot_response, extract_holder_wallets
+from velocity import mention_counter
+from dedup import RecentMessages, content_key
+import metrics
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _peer(value):
+    # Peer ids are stored as BIGINT; work item payloads carry them as strings
+    return int(value) if value is not None else None
+
+_messages = metrics.counter('pipeline_messages_total', 'Messages run through the analysis pipeline')
+_mentions = metrics.counter('pipeline_mentions_total', 'CA mentions detected')
+_message_lag = metrics.histogram('pipeline_message_lag_seconds', 'Gap between message time and processing time',
+                                 buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300))
+_persist_latency = metrics.histogram('pipeline_persist_seconds', 'Time to queue the raw message for persistence')
+_extract_latency = metrics.histogram('pipeline_extract_seconds', 'CA extraction time per message')
+_velocity_latency = metrics.histogram('pipeline_velocity_seconds', 'Velocity counter update and read per mention')
+_parse_latency = metrics.histogram('pipeline_rick_parse_seconds', 'Rick Bot response parse time')
+
+
+class Pipeline:
+    """
+    The per-message analysis steps of the worker: persist the message, extract CAs,
+    update velocity and score, request Rick Bot audits and apply their replies.
+
+    `writer` is a persistence.WriteBehindWriter and `dispatch` an async callable
+    (ca, score) that requests an audit; both are injected so the same pipeline
+    runs inside the all-in-one worker and inside analysis processes.
+
+    Tokens are never read here: the writer upserts the new fields and rescores
+    the merged row when it flushes, then hands the scores back to request_audits.
+
+    With a holders.HolderProfiler, the top-holder wallets of each audit are
+    profiled in the background and fed back as the token's smart_money_ratio.
+
+    In replay mode (backfill.py) message timestamps are the clock for velocity
+    and duplicate detection, and no audits are requested.
+    """
+
+    def __init__(self, writer, dispatch, counter=mention_counter, recent=None, holders=None, replay=False):
+        self.writer = writer
+        self.dispatch = dispatch
+        self.holders = holders
+        self.replay = replay
+        self.counter = counter
+        self.recent = recent if recent is not None else RecentMessages()
+        writer.on_scored = self.request_audits
+
+    async def request_audits(self, scores):
+        # Queue for Rick Bot (deduplicated, paced, hottest first)
+        for ca, score in scores.items():
+            await self.dispatch(ca, score)
+
+    async def handle_message(self, chat_id, sender_id, text, is_rick=False, reply_ca=None, timestamp=None, links=()):
+        now = datetime.utcnow()
+        if timestamp:
+            _message_lag.observe(max(0.0, (now - timestamp).total_seconds()))
+        timestamp = timestamp or now
+        _messages.inc()
+
+        # 1. Save to raw messages feed (flushed in batches by the writer task)
+        with _persist_latency.time():
+            await self.writer.add_message(_peer(chat_id), _peer(sender_id), text, timestamp)
+
+        # 2. Case: Message from monitored channels
+        if not is_rick:
+            # Cross-posts and forwards of a recent message are still counted
+            # for velocity, but not re-sent to Rick Bot
+            key = content_key(text)
+            found = None
+            if key is not None:
+                clock = (timestamp - _EPOCH).total_seconds() if self.replay else None
+                found = self.recent.get(key, clock)
+            repeat = found is not None
+            if not repeat:
+                with _extract_latency.time():
+                    found = extract_cas(text)
+                if key is not None:
+                    self.recent.put(key, found, clock)
+            for ca, platform in found:
+                await self.handle_mention(ca, platform, chat_id, timestamp, audit=not (repeat or self.replay))
+
+        # 3. Case: Message from Rick Bot
+        else:
+            await self.handle_rick_reply(text, reply_ca, links, timestamp)
+
+    async def handle_mention(self, ca, platform, chat_id, timestamp=None, audit=True):
+        if audit:
+            print(f"Detected CA: {ca} on {platform}. Queuing for Rick Bot...")
+        _mentions.inc()
+
+        # Log the mention
+        await self.writer.add_mention(ca, _peer(chat_id), timestamp)
+        with _velocity_latency.time():
+            self.counter.record(ca, timestamp)
+            counts = self.counter.counts(ca, timestamp)
+
+        # Update Velocity; scored and sent for audit once the writer flushes it
+        await self.writer.update_token(ca, {
+            "platform": platform,
+            "mentions_5m": counts[0], "mentions_15m": counts[1], "mentions_1h": counts[2],
+        }, audit=audit)
+
+    async def handle_rick_reply(self, text, ca=None, links=(), timestamp=None):
+        print("Received response from Rick Bot. Analyzing...")
+        with _parse_latency.time():
+            parsed_data = parse_rick_bot_response(text)
+
+        # The address in the text wins: a mismatch means the reply was matched to the wrong request
+        text_ca = parsed_data.get('contract_address')
+        if ca and text_ca and text_ca != ca:
+            print(f"Rick Bot reply for {text_ca} matched request {ca}; using {text_ca}")
+        elif ca:
+            parsed_data['contract_address'] = ca
+
+        if 'contract_address' not in parsed_data:
+            return None
+        ca = parsed_data['contract_address']
+        m5, m15, m1h = self.counter.counts(ca, timestamp)
+
+        # Merged into the stored token and rescored in the writer's upsert
+        await self.writer.update_token(ca, dict(
+            parsed_data, mentions_5m=m5, mentions_15m=m15, mentions_1h=m1h,
+        ))
+        # The full raw text goes to the token's audit history
+        await self.writer.add_audit(ca, text, timestamp)
+        print(f"Updated token info and score for {ca}")
+
+        # Profile the top holders off the hot path; their wallets sit behind Rick's links
+        if self.holders is not None and not self.replay:
+            holders = extract_holder_wallets(text, links, exclude=(ca,))
+            if holders:
+                self.holders.submit(ca, holders)
+        return ca
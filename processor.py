@@ -0,0 +1,156 @@
+import os
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from dotenv import load_dotenv
+from models import SessionLocal, async_engine, init_db
+from parser import parse_rick_bot_response
+from pipeline import Pipeline
+from persistence import WriteBehindWriter
+from velocity import warm_from_db
+from rescoring import rescore_loop
+from leaderboard import leaderboard_loop
+from holders import start_profiler, stop_profiler
+import metrics
+from workqueue import WorkConsumer, enqueue, shard_for, INGEST_SHARD, ANALYSIS_SHARD_COUNT
+
+load_dotenv()
+
+# Shards handled by this process, e.g. "0,1". Defaults to all of them (single analysis worker).
+ANALYSIS_SHARDS = [
+    int(s) for s in os.getenv('ANALYSIS_SHARDS', ','.join(map(str, range(ANALYSIS_SHARD_COUNT)))).split(',')
+    if s.strip()
+]
+# Rows produced by claimed items whose transaction failed, kept for their redelivery
+REPLAY_CACHE_MAX = int(os.getenv('REPLAY_CACHE_MAX', '2000'))
+# Analysis workers share a host with the ingest worker (METRICS_PORT), so each
+# serves /metrics on its own port; by default METRICS_PORT + 1 + its lowest shard
+PROCESSOR_METRICS_PORT = int(os.getenv(
+    'PROCESSOR_METRICS_PORT', str(metrics.METRICS_PORT + 1 + min(ANALYSIS_SHARDS, default=0) if metrics.METRICS_PORT else 0)))
+
+
+def _ts(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class ShardedPipeline(Pipeline):
+    """
+    Pipeline for an analysis worker that owns a subset of CA shards.
+
+    Velocity counters live in memory, so every mention of a CA must be counted
+    by the same process: mentions and Rick replies for CAs owned by another
+    shard are forwarded to it through the work queue instead of processed here.
+    Audit requests go back to the ingest process, which owns the Telegram client.
+    """
+
+    def __init__(self, writer, shards=ANALYSIS_SHARDS, shard_count=ANALYSIS_SHARD_COUNT, holders=None):
+        super().__init__(writer, dispatch=None, holders=holders)
+        self.shards = frozenset(shards)
+        self.shard_count = shard_count
+
+    def owns(self, ca):
+        return shard_for(ca, self.shard_count) in self.shards
+
+    async def handle_mention(self, ca, platform, chat_id, timestamp=None, audit=True):
+        if not self.owns(ca):
+            await self.writer.add_work('mention', {
+                "ca": ca, "platform": platform, "chat_id": chat_id,
+                "ts": timestamp.isoformat() if timestamp else None, "audit": audit,
+            }, shard_for(ca, self.shard_count))
+            return
+        await super().handle_mention(ca, platform, chat_id, timestamp, audit)
+
+    async def handle_rick_reply(self, text, ca=None, links=(), timestamp=None):
+        owner_ca = parse_rick_bot_response(text).get('contract_address') or ca
+        if owner_ca and not self.owns(owner_ca):
+            await self.writer.add_work('rick_reply', {
+                "text": text, "ca": ca, "links": list(links),
+                "ts": timestamp.isoformat() if timestamp else None,
+            }, shard_for(owner_ca, self.shard_count))
+            return owner_ca
+        return await super().handle_rick_reply(text, ca, links, timestamp)
+
+    async def request_audits(self, scores):
+        # Called from the writer task, so written directly rather than through the writer queue
+        await enqueue([
+            ('rick_request', {"ca": ca, "score": float(score or 0)}, INGEST_SHARD) for ca, score in scores.items()
+        ])
+
+    async def handle_item(self, kind, payload):
+        if kind == 'message':
+            await self.handle_message(payload['chat_id'], payload['sender_id'], payload['text'],
+                                      payload.get('is_rick', False), payload.get('ca'), _ts(payload.get('ts')),
+                                      payload.get('links', ()))
+        elif kind == 'mention':
+            await self.handle_mention(payload['ca'], payload['platform'], payload['chat_id'],
+                                      _ts(payload.get('ts')), payload.get('audit', True))
+        elif kind == 'rick_reply':
+            await self.handle_rick_reply(payload['text'], payload.get('ca'), payload.get('links', ()),
+                                         _ts(payload.get('ts')))
+        else:
+            print(f"Unknown work item kind: {kind}")
+
+
+async def main():
+    init_db()
+
+    # Holder profiles are written behind; a claim's own rows go out in its transaction
+    writer = WriteBehindWriter()
+    writer.start()
+    claim_writer = WriteBehindWriter(max_queue=0)
+    holders = start_profiler(writer)
+    pipeline = ShardedPipeline(claim_writer, holders=holders)
+
+    with SessionLocal() as db:
+        warm_from_db(db, owns=pipeline.owns)
+
+    metrics.serve(PROCESSOR_METRICS_PORT)
+    asyncio.create_task(metrics.log_loop())
+
+    # Rescoring and the leaderboard cover all tokens, so exactly one worker runs them
+    if 0 in pipeline.shards:
+        asyncio.create_task(rescore_loop())
+        asyncio.create_task(leaderboard_loop())
+
+    # Velocity and duplicate detection live in memory, so a redelivered item must
+    # not be processed again: it reuses the rows it produced the first time.
+    produced = OrderedDict()
+
+    async def handle_batch(items, db):
+        rows = {}
+        for item in items:
+            item_rows = produced.pop(item.id, None)
+            if item_rows is None:
+                try:
+                    await pipeline.handle_item(item.kind, item.payload)
+                except Exception as e:
+                    print(f"Error processing work item {item.id} ({item.kind}): {e}")
+                item_rows = claim_writer.take()
+            rows[item.id] = item_rows
+        # Kept until the claim commits; written in the claiming transaction, so
+        # they land exactly when the items are deleted
+        produced.update(rows)
+        while len(produced) > REPLAY_CACHE_MAX:
+            produced.popitem(last=False)
+        written = await claim_writer.write_in(db, [r for item_rows in rows.values() for r in item_rows])
+
+        async def committed():
+            for item_id in rows:
+                produced.pop(item_id, None)
+            await written()
+        return committed
+
+    print(f"Analysis worker running for shards {sorted(pipeline.shards)} of {pipeline.shard_count}...")
+    try:
+        await WorkConsumer(ANALYSIS_SHARDS).run(handle_batch)
+    finally:
+        await stop_profiler(holders)
+        await writer.close()
+        await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nStopping analysis worker gracefully...")
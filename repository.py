@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import func, insert, update, values, column, Integer, Numeric, Boolean, Text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import Token, TokenAudit
+from audits import pack
+from scoring import score_arrays, notes_for
+import metrics
+
+# Token columns read by the scoring rules, in score_arrays order
+SCORE_INPUTS = ('liquidity', 'fdv', 'rick_score', 'top_holders_percent', 'mentions_5m', 'mentions_15m',
+                'smart_money_ratio')
+# Token columns written by scoring
+SCORE_OUTPUTS = ('moonshot_score', 'is_gold', 'trader_notes')
+# Set on insert but never overwritten (a CA does not change chain)
+KEEP_EXISTING = ('platform',)
+# Rows per INSERT ... VALUES statement, well below Postgres' bind parameter limit
+UPSERT_CHUNK = 1000
+# CAs whose tokens.id is kept in memory
+TOKEN_ID_CACHE_SIZE = int(os.getenv('TOKEN_ID_CACHE_SIZE', '100000'))
+
+_score_latency = metrics.histogram('pipeline_score_seconds', 'Scoring time per flushed batch of tokens')
+_upserted = metrics.counter('token_upserts_total', 'Token rows upserted')
+_id_hits = metrics.counter('token_id_cache_hits_total', 'Token id lookups answered from memory')
+_id_misses = metrics.counter('token_id_cache_misses_total', 'Token id lookups that went to the database')
+_id_entries = metrics.gauge('token_id_cache_entries', 'CAs in the token id cache')
+
+
+class TokenIds:
+    """
+    In-process CA -> tokens.id interning cache, least recently used evicted first.
+    Ids never change once assigned, so entries need no invalidation; ids learned
+    inside a transaction are added with update() only once it has committed.
+    """
+
+    def __init__(self, max_size=TOKEN_ID_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+
+    def get(self, ca):
+        token_id = self._ids.get(ca)
+        if token_id is not None:
+            self._ids.move_to_end(ca)
+        return token_id
+
+    def put(self, ca, token_id):
+        # One shared string per CA however many messages mention it
+        self._ids[sys.intern(ca)] = token_id
+        self._ids.move_to_end(ca)
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+        _id_entries.set(len(self._ids))
+
+    def update(self, ids):
+        for ca, token_id in ids.items():
+            self.put(ca, token_id)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+token_ids = TokenIds()
+
+
+def merge_rows(rows):
+    """
+    Collapses partial token rows to one per contract_address, later fields winning.
+    One INSERT ... ON CONFLICT DO UPDATE cannot touch the same row twice.
+    """
+    merged = {}
+    for row in rows:
+        merged.setdefault(row['contract_address'], {}).update(row)
+    return list(merged.values())
+
+
+def _group_by_columns(rows):
+    # A multi-row VALUES list needs every row to share the same keys
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return list(groups.values())
+
+
+async def upsert_tokens(db, rows, returning=()):
+    """
+    Writes partial token rows with INSERT ... ON CONFLICT (contract_address) DO UPDATE
+    on an AsyncSession, one statement per column set and chunk, updating only the
+    columns each row carries.
+    With `returning`, gives {ca: Row} of those columns as stored after the merge.
+    """
+    table = Token.__table__
+    result = {}
+    for group in _group_by_columns(merge_rows(rows)):
+        cols = [c for c in group[0] if c != 'contract_address']
+        for i in range(0, len(group), UPSERT_CHUNK):
+            stmt = pg_insert(table).values(group[i:i + UPSERT_CHUNK])
+            set_ = {
+                c: func.coalesce(table.c[c], stmt.excluded[c]) if c in KEEP_EXISTING else stmt.excluded[c]
+                for c in cols
+            }
+            if set_:
+                stmt = stmt.on_conflict_do_update(index_elements=['contract_address'], set_=set_)
+            elif returning:
+                # DO NOTHING returns no row on conflict; a no-op update does
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['contract_address'],
+                    set_={'contract_address': stmt.excluded.contract_address},
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=['contract_address'])
+            if returning:
+                stmt = stmt.returning(table.c.contract_address, *(table.c[c] for c in returning))
+                for row in await db.execute(stmt):
+                    result[row.contract_address] = row
+            else:
+                await db.execute(stmt)
+            _upserted.inc(min(UPSERT_CHUNK, len(group) - i))
+    return result
+
+
+async def resolve_token_ids(db, cas, ids, cache=token_ids):
+    """
+    Fills `ids` ({ca: tokens.id} already known in this transaction) for cas,
+    creating tokens that don't exist yet. Only CAs missing from both reach the
+    database, in one upsert. Returns ids.
+    """
+    cas, missing = list(dict.fromkeys(cas)), []
+    for ca in cas:
+        if ca not in ids:
+            token_id = cache.get(ca)
+            if token_id is None:
+                missing.append(ca)
+            else:
+                ids[ca] = token_id
+    _id_hits.inc(len(cas) - len(missing))
+    if missing:
+        _id_misses.inc(len(missing))
+        stored = await upsert_tokens(db, [{"contract_address": ca} for ca in missing], returning=('id',))
+        ids.update((ca, row.id) for ca, row in stored.items())
+    return ids
+
+
+async def mention_rows(db, mentions, ids):
+    """
+    Turns queued mentions ({contract_address, channel_id, timestamp}) into token_mentions rows.
+    """
+    await resolve_token_ids(db, [m['contract_address'] for m in mentions], ids)
+    return [
+        {"token_id": ids[m['contract_address']], "channel_id": m['channel_id'], "timestamp": m['timestamp']}
+        for m in mentions
+    ]
+
+
+async def append_audits(db, audits, ids):
+    """
+    Appends Rick Bot responses ({contract_address, text, created_at}) to token_audits,
+    compressed, and points each token's latest_audit_id at its newest one.
+    """
+    await resolve_token_ids(db, [a['contract_address'] for a in audits], ids)
+    table = TokenAudit.__table__
+    stmt = insert(table).values([
+        {"token_id": ids[a['contract_address']], "raw": pack(a['text']),
+         "raw_size": len(a['text'].encode()), "created_at": a['created_at']}
+        for a in audits
+    ]).returning(table.c.id, table.c.token_id)
+    latest = {}
+    for audit_id, token_id in await db.execute(stmt):
+        latest[token_id] = max(audit_id, latest.get(token_id, 0))
+    await db.execute(update(Token), [{"id": t, "latest_audit_id": a} for t, a in latest.items()])
+
+
+_SCORE_COLUMNS = tuple(zip(SCORE_OUTPUTS, (Numeric, Boolean, Text)))
+
+
+async def write_scores(db, records):
+    """
+    Writes (id, moonshot_score, is_gold, trader_notes) records with UPDATE ... FROM (VALUES ...),
+    like rescoring.bulk_update. Unlike another INSERT ... ON CONFLICT it draws no
+    tokens.id sequence values.
+    """
+    conn = await db.connection()
+    if conn.dialect.name != 'postgresql':
+        # No column list on a VALUES alias elsewhere (SQLite benchmarks): update by primary key
+        await db.execute(update(Token), [dict(zip(('id',) + SCORE_OUTPUTS, r)) for r in records])
+        return
+    table = Token.__table__
+    for i in range(0, len(records), UPSERT_CHUNK):
+        v = values(column('id', Integer), *(column(c, t) for c, t in _SCORE_COLUMNS), name='v').data(
+            records[i:i + UPSERT_CHUNK])
+        await db.execute(update(table).where(table.c.id == v.c.id).values({c: v.c[c] for c, _ in _SCORE_COLUMNS}))
+
+
+async def upsert_and_score(db, rows, ids=None):
+    """
+    Upserts token rows, scores the merged tokens in one vectorized pass and writes
+    the scores back by id: two statements per batch however many mentions it holds.
+    The tokens' ids are added to `ids` when given. Returns {ca: moonshot_score}.
+    """
+    stored = await upsert_tokens(db, rows, returning=('id',) + SCORE_INPUTS)
+    if not stored:
+        return {}
+    if ids is not None:
+        ids.update((ca, row.id) for ca, row in stored.items())
+
+    started = time.perf_counter()
+    cas = list(stored)
+    inputs = np.array(
+        [[np.nan if v is None else float(v) for v in stored[ca][2:]] for ca in cas], dtype=float,
+    ).reshape(len(cas), len(SCORE_INPUTS)).T
+    scores, gold, bits = score_arrays(*inputs)
+    notes = notes_for(bits)
+    _score_latency.observe(time.perf_counter() - started)
+
+    await write_scores(db, [
+        (stored[ca].id, float(scores[i]), bool(gold[i]), notes[i]) for i, ca in enumerate(cas)
+    ])
+    return {ca: float(scores[i]) for i, ca in enumerate(cas)}
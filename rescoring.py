@@ -0,0 +1,113 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta
+import pandas as pd
+from sqlalchemy import text, values, column, update, Integer, Numeric, Boolean, Text
+from models import SessionLocal, Token
+from scoring import score_frame
+import metrics
+
+RESCORE_INTERVAL = int(os.getenv('RESCORE_INTERVAL', '60'))
+RESCORE_ACTIVE_HOURS = int(os.getenv('RESCORE_ACTIVE_HOURS', '6'))
+RESCORE_CHUNK = 1000
+
+_rescore_seconds = metrics.histogram('rescore_seconds', 'Duration of one rescoring pass')
+_rescored_rows = metrics.counter('rescore_updated_rows_total', 'Token rows changed by the rescoring pass')
+
+# Every live token in one query: recently created, still mentioned, or still gold
+# (so a token that went quiet loses its velocity points and gold flag).
+ACTIVE_TOKENS_SQL = text("""
+    SELECT t.id, t.liquidity, t.fdv, t.rick_score, t.top_holders_percent, t.smart_money_ratio,
+           t.mentions_5m AS old_5m, t.mentions_15m AS old_15m, t.mentions_1h AS old_1h,
+           t.moonshot_score AS old_score, t.is_gold AS old_gold, t.trader_notes AS old_notes,
+           COALESCE(m.m5, 0) AS mentions_5m, COALESCE(m.m15, 0) AS mentions_15m, COALESCE(m.m1h, 0) AS mentions_1h
+    FROM bot_schema.tokens t
+    LEFT JOIN (
+        SELECT token_id,
+               sum(mentions) FILTER (WHERE bucket_start >= :now - interval '5 minutes') AS m5,
+               sum(mentions) FILTER (WHERE bucket_start >= :now - interval '15 minutes') AS m15,
+               sum(mentions) AS m1h
+        FROM bot_schema.token_mention_history
+        WHERE bucket_start >= :now - interval '1 hour' AND bucket_seconds <= 60
+        GROUP BY token_id
+    ) m ON m.token_id = t.id
+    WHERE t.created_at >= :since OR t.mentions_1h > 0 OR t.is_gold OR m.m1h > 0
+""")
+
+_UPDATE_COLUMNS = (
+    ('mentions_5m', Integer), ('mentions_15m', Integer), ('mentions_1h', Integer),
+    ('moonshot_score', Numeric), ('is_gold', Boolean), ('trader_notes', Text),
+)
+
+
+def load_active_tokens(db, hours=RESCORE_ACTIVE_HOURS, now=None):
+    now = now or datetime.utcnow()
+    result = db.execute(ACTIVE_TOKENS_SQL, {"now": now, "since": now - timedelta(hours=hours)})
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def changed_rows(df):
+    """
+    Scores df in one vectorized pass and returns only rows whose stored values differ.
+    """
+    if df.empty:
+        return df
+    scored = score_frame(df)
+    df = df.assign(**{c: scored[c] for c in scored.columns})
+    old_score = pd.to_numeric(df['old_score'], errors='coerce').astype(float).fillna(-1)
+    changed = (
+        (df['mentions_5m'] != df['old_5m'].fillna(-1))
+        | (df['mentions_15m'] != df['old_15m'].fillna(-1))
+        | (df['mentions_1h'] != df['old_1h'].fillna(-1))
+        | (df['moonshot_score'] != old_score)
+        | (df['is_gold'] != df['old_gold'].fillna(False).astype(bool))
+        | (df['trader_notes'] != df['old_notes'].fillna(""))
+    )
+    return df.loc[changed, ['id'] + [c for c, _ in _UPDATE_COLUMNS]]
+
+
+def bulk_update(db, df):
+    """
+    Writes the given rows back with UPDATE ... FROM (VALUES ...), one statement per chunk.
+    """
+    table = Token.__table__
+    records = [
+        (int(r.id), int(r.mentions_5m), int(r.mentions_15m), int(r.mentions_1h),
+         float(r.moonshot_score), bool(r.is_gold), r.trader_notes)
+        for r in df.itertuples(index=False)
+    ]
+    for i in range(0, len(records), RESCORE_CHUNK):
+        v = values(column('id', Integer), *(column(c, t) for c, t in _UPDATE_COLUMNS), name='v').data(
+            records[i:i + RESCORE_CHUNK])
+        db.execute(update(table).where(table.c.id == v.c.id).values({c: v.c[c] for c, _ in _UPDATE_COLUMNS}))
+    db.commit()
+    return len(records)
+
+
+def rescore_active_tokens(session_factory=SessionLocal, hours=RESCORE_ACTIVE_HOURS):
+    started = time.perf_counter()
+    with session_factory() as db:
+        df = changed_rows(load_active_tokens(db, hours))
+        updated = bulk_update(db, df) if not df.empty else 0
+    _rescored_rows.inc(updated)
+    _rescore_seconds.observe(time.perf_counter() - started)
+    return updated
+
+
+async def rescore_loop(interval=RESCORE_INTERVAL):
+    """
+    Periodically decays velocity and scores for every live token.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            updated = await asyncio.to_thread(rescore_active_tokens)
+            if updated:
+                print(f"Rescoring updated {updated} tokens.")
+        except Exception as e:
+            print(f"Error during rescoring: {e}")
+
+
+if __name__ == "__main__":
+    print(f"Updated {rescore_active_tokens()} tokens.")
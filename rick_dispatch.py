@@ -0,0 +1,257 @@
+import os
+import time
+import heapq
+import asyncio
+from collections import OrderedDict
+from telethon.errors import FloodWaitError
+from ratelimit import TokenBucket
+import metrics
+
+# Don't re-query the same CA within this many seconds
+RICK_DEDUP_TTL = float(os.getenv('RICK_DEDUP_TTL', '600'))
+# Sustained send rate (messages/sec) and burst size towards Rick Bot
+RICK_SEND_RATE = float(os.getenv('RICK_SEND_RATE', '0.5'))
+RICK_SEND_BURST = int(os.getenv('RICK_SEND_BURST', '3'))
+# Seconds to wait for Rick's reply before retrying, and how many sends per CA
+RICK_REPLY_TIMEOUT = float(os.getenv('RICK_REPLY_TIMEOUT', '45'))
+RICK_MAX_ATTEMPTS = int(os.getenv('RICK_MAX_ATTEMPTS', '3'))
+# Bound on CAs waiting to be sent (the lowest scores are dropped first) and the score
+# a CA needs to be queued at all; pending CAs older than the dedup TTL are dropped as stale
+RICK_PENDING_MAX = int(os.getenv('RICK_PENDING_MAX', '500'))
+RICK_MIN_SCORE = float(os.getenv('RICK_MIN_SCORE', '0'))
+
+_sent = metrics.counter('rick_sent_total', 'CAs sent to Rick Bot')
+_send_latency = metrics.histogram('rick_send_seconds', 'Telegram send_message latency for Rick Bot requests')
+_deduped = metrics.counter('rick_deduped_total', 'CA submissions skipped because they were sent recently')
+_flood_waits = metrics.counter('rick_flood_waits_total', 'FloodWaitError responses from Telegram')
+_send_errors = metrics.counter('rick_send_errors_total', 'Failed sends to Rick Bot')
+_pending_depth = metrics.gauge('rick_pending', 'CAs waiting to be sent to Rick Bot')
+_inflight_depth = metrics.gauge('rick_inflight', 'Sent CAs still waiting for a Rick Bot reply')
+_timeouts = metrics.counter('rick_reply_timeouts_total', 'Rick Bot requests that got no reply in time')
+_retries = metrics.counter('rick_retries_total', 'Rick Bot requests re-sent after a timeout')
+_pending_dropped = metrics.counter('rick_pending_dropped_total',
+                                   'CAs dropped before sending: below the score floor, queue full or stale')
+_unmatched = metrics.counter('rick_unmatched_replies_total', 'Rick Bot replies with no pending request')
+_roundtrip = metrics.histogram('rick_roundtrip_seconds', 'Time from sending a CA to Rick Bot until its reply',
+                               buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+_mention_to_score = metrics.histogram('rick_mention_to_score_seconds',
+                                      'Time from first submission of a CA until its audit reply',
+                                      buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600))
+
+
+class _Audit:
+    __slots__ = ('ca', 'score', 'sent_at', 'attempts')
+
+    def __init__(self, ca, score, sent_at, attempts):
+        self.ca = ca
+        self.score = score
+        self.sent_at = sent_at
+        self.attempts = attempts
+
+
+class RickDispatcher:
+    """
+    Sends CAs to Rick Bot from a single background task.
+    Pending CAs are sent highest moonshot_score first, each CA at most once per TTL,
+    and sends are paced by a token bucket that also absorbs FloodWaitError.
+    When CAs arrive faster than they can be sent, the pending set is capped at
+    max_pending and a CA still unsent after the TTL is dropped: its audit would
+    be stale by then, and a later mention queues it again.
+    """
+
+    def __init__(self, client, rick_bot_id, ttl=RICK_DEDUP_TTL,
+                 rate=RICK_SEND_RATE, burst=RICK_SEND_BURST,
+                 max_pending=RICK_PENDING_MAX, min_score=RICK_MIN_SCORE):
+        self.client = client
+        self.rick_bot_id = rick_bot_id
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.min_score = min_score
+        self.bucket = TokenBucket(rate, burst)
+        self._entity = None
+        self._heap = []           # (-score, seq, ca)
+        self._scores = {}         # ca -> score of its live heap entry
+        self._queued_at = {}      # ca -> monotonic time it became pending
+        self._last_sent = {}      # ca -> monotonic time of last send
+        self._inflight = OrderedDict()  # sent message id -> _Audit, oldest first
+        self._inflight_ids = {}         # ca -> sent message id
+        self._attempts = {}             # ca -> sends so far for the current audit
+        self._first_submitted = {}      # ca -> monotonic time the current audit was requested
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def entity(self):
+        if self._entity is None:
+            self._entity = await self.client.get_entity(self.rick_bot_id)
+        return self._entity
+
+    def submit(self, ca, score=0, retry=False):
+        """
+        Queues ca for an audit. Returns False if it was sent within the TTL,
+        is still waiting for a reply, scores below min_score or lost its place
+        in a full queue. A CA already pending only has its priority refreshed.
+        """
+        score = float(score or 0)
+        now = time.monotonic()
+        if not retry:
+            sent_at = self._last_sent.get(ca)
+            if ca in self._inflight_ids or (sent_at is not None and now - sent_at < self.ttl):
+                _deduped.inc()
+                return False
+            if score < self.min_score and ca not in self._scores:
+                _pending_dropped.inc()
+                return False
+            self._first_submitted.setdefault(ca, now)
+        if self._scores.get(ca) == score:
+            return True
+        if ca not in self._scores:
+            if len(self._scores) >= self.max_pending:
+                # Full: the lowest score pending goes, which may be this one
+                lowest = min(self._scores, key=self._scores.get)
+                if self._scores[lowest] >= score:
+                    _pending_dropped.inc()
+                    self._forget(ca)
+                    return False
+                self._drop_pending(lowest)
+            self._queued_at[ca] = now
+        self._scores[ca] = score
+        self._seq += 1
+        heapq.heappush(self._heap, (-score, self._seq, ca))
+        if len(self._heap) > 4 * self.max_pending:
+            # Drop entries superseded by score updates or evictions
+            self._heap = [e for e in self._heap if self._scores.get(e[2]) == -e[0]]
+            heapq.heapify(self._heap)
+        _pending_depth.set(len(self._scores))
+        self._wakeup.set()
+        return True
+
+    def _drop_pending(self, ca):
+        del self._scores[ca]
+        self._queued_at.pop(ca, None)
+        self._forget(ca)
+        _pending_dropped.inc()
+        _pending_depth.set(len(self._scores))
+
+    def _pop(self):
+        now = time.monotonic()
+        while self._heap:
+            neg_score, _, ca = heapq.heappop(self._heap)
+            # Entries superseded by a later score update are skipped
+            if self._scores.get(ca) != -neg_score:
+                continue
+            if now - self._queued_at.get(ca, now) >= self.ttl:
+                self._drop_pending(ca)
+                continue
+            del self._scores[ca]
+            self._queued_at.pop(ca, None)
+            _pending_depth.set(len(self._scores))
+            return ca, -neg_score
+        return None, None
+
+    def _prune(self, now):
+        expired = [ca for ca, t in self._last_sent.items() if now - t >= self.ttl]
+        for ca in expired:
+            del self._last_sent[ca]
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def run(self):
+        while True:
+            self._expire_inflight(time.monotonic())
+            ca, score = self._pop()
+            if ca is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=RICK_REPLY_TIMEOUT / 3)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.bucket.acquire()
+            try:
+                sent_msg = await self.send(ca)
+                now = time.monotonic()
+                self._last_sent[ca] = now
+                attempts = self._attempts.get(ca, 0) + 1
+                self._attempts[ca] = attempts
+                self._inflight[sent_msg.id] = _Audit(ca, score, now, attempts)
+                self._inflight_ids[ca] = sent_msg.id
+                _inflight_depth.set(len(self._inflight))
+                _sent.inc()
+                if len(self._last_sent) > 1000:
+                    self._prune(now)
+                print(f"Successfully forwarded CA to Rick Bot (Msg ID: {sent_msg.id})")
+            except FloodWaitError as e:
+                _flood_waits.inc()
+                print(f"⏳ Rick Bot flood wait: sleeping {e.seconds}s")
+                self.bucket.penalize(e.seconds)
+                self.submit(ca, score, retry=True)
+            except Exception as e:
+                _send_errors.inc()
+                self._forget(ca)
+                print(f"❌ FAILED to send to Rick Bot: {e}")
+
+    def _expire_inflight(self, now):
+        # _inflight is ordered by send time, so expired requests sit at the front
+        while self._inflight:
+            msg_id, audit = next(iter(self._inflight.items()))
+            if now - audit.sent_at < RICK_REPLY_TIMEOUT:
+                break
+            self._drop_inflight(msg_id, audit)
+            _timeouts.inc()
+            if audit.attempts < RICK_MAX_ATTEMPTS:
+                _retries.inc()
+                self.submit(audit.ca, audit.score, retry=True)
+            else:
+                print(f"⌛ Rick Bot never answered for {audit.ca} after {audit.attempts} attempts")
+                self._forget(audit.ca)
+
+    def _drop_inflight(self, msg_id, audit):
+        del self._inflight[msg_id]
+        if self._inflight_ids.get(audit.ca) == msg_id:
+            del self._inflight_ids[audit.ca]
+        _inflight_depth.set(len(self._inflight))
+
+    def _forget(self, ca):
+        self._attempts.pop(ca, None)
+        self._first_submitted.pop(ca, None)
+
+    def match_reply(self, message):
+        """
+        Returns the CA a Rick Bot reply answers, or None if no request matches.
+        Matches on reply_to; only a reply without one falls back to the oldest
+        request in flight. A reply to a request no longer in flight (a late
+        answer to one that timed out and was re-sent) matches nothing.
+        """
+        msg_id = message.reply_to_msg_id
+        if msg_id is not None:
+            audit = self._inflight.get(msg_id)
+        elif self._inflight:
+            msg_id, audit = next(iter(self._inflight.items()))
+        else:
+            audit = None
+        if audit is None:
+            _unmatched.inc()
+            return None
+        self._drop_inflight(msg_id, audit)
+
+        now = time.monotonic()
+        _roundtrip.observe(now - audit.sent_at)
+        first = self._first_submitted.get(audit.ca)
+        if first is not None:
+            _mention_to_score.observe(now - first)
+        self._forget(audit.ca)
+        return audit.ca
+
+    async def send(self, ca):
+        entity = await self.entity()
+        with _send_latency.time():
+            return await self.client.send_message(entity, ca)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -1,76 +1,139 @@
-from datetime import datetime, timedelta
-from models import Token, TokenMention, SessionLocal
-from sqlalchemy import func
+import numpy as np
+import pandas as pd
+from models import Token
+from velocity import mention_counter
 
-def calculate_moonshot_score(token: Token, db):
+# Trader notes, one bit each in the note bitmask returned by score_arrays
+NOTES = (
+    "🔥 High Social Velocity (5m)",
+    "📈 Growing Interest (15m)",
+    "✅ Healthy Liquidity/MC ratio",
+    "⚠️ Extremely Low Liquidity (High Risk)",
+    "🛡️ Clean Audit from Rick Bot",
+    "🚨 Top Holders > 40% (Potential Rug)",
+    "💎 Great Holder Distribution",
+    "🧠 Smart Money Holding",
+)
+(NOTE_HIGH_VELOCITY, NOTE_GROWING_INTEREST, NOTE_HEALTHY_LIQUIDITY, NOTE_LOW_LIQUIDITY,
+ NOTE_CLEAN_AUDIT, NOTE_TOP_HOLDERS_RUG, NOTE_GOOD_DISTRIBUTION, NOTE_SMART_MONEY) = (1 << i for i in range(len(NOTES)))
+
+# Every possible bitmask pre-joined, so decoding notes is a table lookup
+_NOTE_STRINGS = np.array(
+    [" | ".join(n for i, n in enumerate(NOTES) if mask & (1 << i)) for mask in range(1 << len(NOTES))],
+    dtype=object,
+)
+
+GOLD_THRESHOLD = 80
+# Share of profiled top holders that are smart money (see holders.py) earning the bonus
+SMART_MONEY_RATIO = 0.3
+
+def _as_float(values):
+    # Accepts arrays/lists holding None, Decimal or pd.NA; missing -> NaN
+    arr = np.asarray(values)
+    if arr.dtype == object:
+        arr = pd.to_numeric(arr, errors='coerce')
+    return np.asarray(arr, dtype=float)
+
+def _truthy(arr):
+    return ~np.isnan(arr) & (arr != 0)
+
+def score_arrays(liquidity, fdv, rick_score, top_holders_percent, mentions_5m, mentions_15m,
+                 smart_money_ratio=None):
     """
-    Algorithm to score tokens based on momentum, liquidity, and audit.
+    Columnar moonshot scoring. Takes equal-length arrays (None/NaN = missing) and
+    returns (scores, gold flags, note bitmasks) as NumPy arrays.
     Score range: 0 - 100
     """
-    score = 0
-    notes = []
+    liq = _as_float(liquidity)
+    fdv = _as_float(fdv)
+    rick = _as_float(rick_score)
+    top = _as_float(top_holders_percent)
+    m5 = np.nan_to_num(_as_float(mentions_5m))
+    m15 = np.nan_to_num(_as_float(mentions_15m))
+    n = len(liq)
+    score = np.zeros(n)
+    bits = np.zeros(n, dtype=np.int64)
 
-    # 1. Mention Velocity (Max 40 points)
+    # 1. Mention Velocity (Max 30 points)
     # Higher velocity in short timeframes = higher score
-    if token.mentions_5m >= 3:
-        score += 30
-        notes.append("🔥 High Social Velocity (5m)")
-    elif token.mentions_15m >= 5:
-        score += 20
-        notes.append("📈 Growing Interest (15m)")
-    
-    # 2. Liquidity & FDV Ratio (Max 30 points)
-    if token.liquidity and token.fdv:
-        liq_to_mc = (float(token.liquidity) / float(token.fdv)) * 100
-        if 5 <= liq_to_mc <= 25:
-            score += 20
-            notes.append("✅ Healthy Liquidity/MC ratio")
-        elif liq_to_mc < 2:
-            score -= 10
-            notes.append("⚠️ Extremely Low Liquidity (High Risk)")
-    
+    hot = m5 >= 3
+    growing = ~hot & (m15 >= 5)
+    score += 30 * hot + 20 * growing
+    bits |= hot * NOTE_HIGH_VELOCITY | growing * NOTE_GROWING_INTEREST
+
+    # 2. Liquidity & FDV Ratio (Max 20 points)
+    has_ratio = _truthy(liq) & _truthy(fdv)
+    liq_to_mc = np.divide(liq, fdv, out=np.zeros(n), where=has_ratio) * 100
+    healthy = has_ratio & (liq_to_mc >= 5) & (liq_to_mc <= 25)
+    thin = has_ratio & (liq_to_mc < 2)
+    score += 20 * healthy - 10 * thin
+    bits |= healthy * NOTE_HEALTHY_LIQUIDITY | thin * NOTE_LOW_LIQUIDITY
+
     # 3. Rick Bot Audit (Max 30 points)
-    if token.risk_score:
-        # Assuming lower is better for risk_score from Rick
-        audit_val = max(0, 30 - token.risk_score)
-        score += audit_val
-        if token.risk_score < 5:
-            notes.append("🛡️ Clean Audit from Rick Bot")
-    
+    # Assuming lower is better for Rick's score
+    has_rick = _truthy(rick)
+    rick = np.nan_to_num(rick)
+    score += np.where(has_rick, np.maximum(0, 30 - rick), 0)
+    bits |= (has_rick & (rick < 5)) * NOTE_CLEAN_AUDIT
+
     # 4. Holder Saturation
-    if token.top_holders_percent:
-        if token.top_holders_percent > 40:
-            score -= 20
-            notes.append("🚨 Top Holders > 40% (Potential Rug)")
-        elif token.top_holders_percent < 15:
-            score += 10
-            notes.append("💎 Great Holder Distribution")
-
-    token.moonshot_score = min(100, max(0, score))
-    token.is_gold = token.moonshot_score >= 80
-    token.trader_notes = " | ".join(notes)
+    has_top = _truthy(top)
+    rug = has_top & (top > 40)
+    spread = has_top & (top < 15)
+    score += 10 * spread - 20 * rug
+    bits |= rug * NOTE_TOP_HOLDERS_RUG | spread * NOTE_GOOD_DISTRIBUTION
+
+    # 5. Smart money among the top holders (Max 10 points)
+    if smart_money_ratio is not None:
+        smart = np.nan_to_num(_as_float(smart_money_ratio)) >= SMART_MONEY_RATIO
+        score += 10 * smart
+        bits |= smart * NOTE_SMART_MONEY
+
+    score = np.clip(score, 0, 100)
+    return score, score >= GOLD_THRESHOLD, bits.astype(np.uint8)
+
+def notes_for(bits):
+    """
+    Decodes note bitmasks (scalar or array) into trader_notes strings.
+    """
+    return _NOTE_STRINGS[bits]
+
+def calculate_moonshot_score(token: Token, db=None):
+    """
+    Algorithm to score tokens based on momentum, liquidity, and audit.
+    Thin wrapper over score_arrays for a single Token.
+    """
+    row = [np.nan if v is None else float(v) for v in (
+        token.liquidity, token.fdv, token.rick_score, token.top_holders_percent,
+        token.mentions_5m, token.mentions_15m, token.smart_money_ratio,
+    )]
+    scores, gold, bits = score_arrays(*np.array(row).reshape(7, 1))
+    token.moonshot_score = float(scores[0])
+    token.is_gold = bool(gold[0])
+    token.trader_notes = notes_for(int(bits[0]))
     
     return token
 
-def update_velocity(ca: str, db):
+def score_frame(df):
     """
-    Recalculates mention counts for different timeframes
+    score_arrays over a DataFrame of tokens; returns moonshot_score, is_gold,
+    trader_notes and note_bits aligned to df.
     """
-    now = datetime.utcnow()
-    
-    m5 = db.query(TokenMention).filter(
-        TokenMention.contract_address == ca,
-        TokenMention.timestamp >= now - timedelta(minutes=5)
-    ).count()
-    
-    m15 = db.query(TokenMention).filter(
-        TokenMention.contract_address == ca,
-        TokenMention.timestamp >= now - timedelta(minutes=15)
-    ).count()
-    
-    m1h = db.query(TokenMention).filter(
-        TokenMention.contract_address == ca,
-        TokenMention.timestamp >= now - timedelta(hours=1)
-    ).count()
-    
-    return m5, m15, m1h
+    scores, gold, bits = score_arrays(
+        df['liquidity'].to_numpy(), df['fdv'].to_numpy(), df['rick_score'].to_numpy(),
+        df['top_holders_percent'].to_numpy(), df['mentions_5m'].to_numpy(), df['mentions_15m'].to_numpy(),
+        df['smart_money_ratio'].to_numpy() if 'smart_money_ratio' in df else None,
+    )
+    return pd.DataFrame({
+        "moonshot_score": scores,
+        "is_gold": gold,
+        "trader_notes": notes_for(bits),
+        "note_bits": bits,
+    }, index=df.index)
+
+def update_velocity(ca: str, db=None):
+    """
+    Returns mention counts for different timeframes from the in-memory counter.
+    token_mentions remains the durable log and is only read at startup (see velocity.warm_from_db).
+    """
+    return mention_counter.counts(ca)
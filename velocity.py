@@ -0,0 +1,179 @@
+import os
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# Bucket granularity and the windows we report (5m / 15m / 1h)
+BUCKET_SECONDS = 10
+WINDOWS_SECONDS = (5 * 60, 15 * 60, 60 * 60)
+RING_SIZE = WINDOWS_SECONDS[-1] // BUCKET_SECONDS
+
+# Upper bound on tracked CAs (each ring is RING_SIZE * 4 bytes)
+MAX_TRACKED_CAS = int(os.getenv('VELOCITY_MAX_CAS', '10000'))
+SWEEP_INTERVAL_SECONDS = 60
+
+
+class _Ring:
+    """
+    Per-CA ring of mention buckets with running totals for each window.
+    """
+    __slots__ = ('counts', 'head', 'totals')
+
+    def __init__(self, head):
+        self.counts = array('I', bytes(4 * RING_SIZE))
+        self.head = head
+        self.totals = [0] * len(WINDOWS_SECONDS)
+
+    def advance(self, bucket, spans):
+        if bucket <= self.head:
+            return
+        if bucket - self.head >= RING_SIZE:
+            # Everything we hold has expired
+            self.counts = array('I', bytes(4 * RING_SIZE))
+            self.totals = [0] * len(spans)
+            self.head = bucket
+            return
+        counts = self.counts
+        totals = self.totals
+        for b in range(self.head + 1, bucket + 1):
+            for i, span in enumerate(spans):
+                leaving = b - span
+                if leaving <= self.head:
+                    totals[i] -= counts[leaving % RING_SIZE]
+            counts[b % RING_SIZE] = 0
+        self.head = bucket
+
+    def add(self, bucket, spans, n=1):
+        age = self.head - bucket
+        if age < 0:
+            self.advance(bucket, spans)
+            age = 0
+        if age >= RING_SIZE:
+            return
+        self.counts[bucket % RING_SIZE] += n
+        for i, span in enumerate(spans):
+            if age < span:
+                self.totals[i] += n
+
+
+class MentionCounter:
+    """
+    Process-local sliding-window mention counter.
+    Answers 5m/15m/1h counts per CA without touching the database.
+    """
+
+    def __init__(self, max_tracked=MAX_TRACKED_CAS, bucket_seconds=BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.spans = tuple(w // bucket_seconds for w in WINDOWS_SECONDS)
+        self.max_tracked = max_tracked
+        self._rings = OrderedDict()
+        self._last_sweep = 0
+
+    def _bucket(self, ts):
+        if ts is None:
+            ts = time.time()
+        elif isinstance(ts, datetime):
+            ts = (ts - datetime(1970, 1, 1)).total_seconds()
+        return int(ts // self.bucket_seconds)
+
+    def record(self, ca, ts=None, n=1):
+        """
+        Registers n mentions of ca at ts (unix seconds or naive UTC datetime).
+        """
+        bucket = self._bucket(ts)
+        ring = self._rings.get(ca)
+        if ring is None:
+            ring = _Ring(bucket)
+            self._rings[ca] = ring
+            if len(self._rings) > self.max_tracked:
+                # Drop the least recently mentioned CA
+                self._rings.popitem(last=False)
+        else:
+            self._rings.move_to_end(ca)
+        ring.add(bucket, self.spans, n)
+        self._maybe_sweep(bucket)
+
+    def counts(self, ca, ts=None):
+        """
+        Returns (m5, m15, m1h) for ca as of ts.
+        """
+        ring = self._rings.get(ca)
+        if ring is None:
+            return 0, 0, 0
+        ring.advance(self._bucket(ts), self.spans)
+        return tuple(ring.totals)
+
+    def evict_idle(self, ts=None):
+        """
+        Forgets CAs with no mention inside the largest window.
+        """
+        bucket = self._bucket(ts)
+        horizon = bucket - self.spans[-1]
+        # Rings are ordered by last mention, so idle ones sit at the front
+        evicted = 0
+        while self._rings:
+            ca, ring = next(iter(self._rings.items()))
+            if ring.head > horizon:
+                break
+            del self._rings[ca]
+            evicted += 1
+        return evicted
+
+    def _maybe_sweep(self, bucket):
+        if (bucket - self._last_sweep) * self.bucket_seconds >= SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = bucket
+            self.evict_idle(bucket * self.bucket_seconds)
+
+    def warm(self, rows):
+        """
+        Seeds the counter from (contract_address, timestamp[, mentions]) rows, oldest first.
+        """
+        loaded = 0
+        for ca, ts, *n in rows:
+            n = n[0] if n else 1
+            self.record(ca, ts, n)
+            loaded += n
+        return loaded
+
+    def __len__(self):
+        return len(self._rings)
+
+
+mention_counter = MentionCounter()
+
+
+def warm_from_db(db, counter=mention_counter, owns=None):
+    """
+    Loads the last hour of mentions into the counter at startup, and the ids of
+    the tokens they mention into repository.token_ids. Mentions already compacted
+    into minute buckets (see migrations.compact_mentions) count at the bucket start.
+    `owns(ca)` restricts warming to the CAs this process is responsible for.
+    """
+    from sqlalchemy import select, union_all, literal
+    from models import Token, TokenMention, TokenMentionRollup
+    from repository import token_ids
+
+    since = datetime.utcnow() - timedelta(seconds=WINDOWS_SECONDS[-1])
+    history = union_all(
+        select(TokenMention.token_id, TokenMention.timestamp.label('ts'), literal(1).label('n'))
+        .where(TokenMention.timestamp >= since),
+        select(TokenMentionRollup.token_id, TokenMentionRollup.bucket_start, TokenMentionRollup.mentions)
+        .where(TokenMentionRollup.bucket_seconds == 60, TokenMentionRollup.bucket_start >= since),
+    ).subquery()
+    rows = db.execute(
+        select(Token.contract_address, history.c.ts, history.c.n, Token.id)
+        .join(Token, Token.id == history.c.token_id)
+        .order_by(history.c.ts)
+        .execution_options(yield_per=5000)
+    )
+    if owns is not None:
+        rows = (r for r in rows if owns(r[0]))
+
+    def entries():
+        for ca, ts, n, token_id in rows:
+            token_ids.put(ca, token_id)
+            yield ca, ts, n
+    loaded = counter.warm(entries())
+    print(f"Velocity counter warmed with {loaded} mentions across {len(counter)} CAs.")
+    return loaded
@@ -1,13 +1,22 @@
 import os
 import json
+import time
 import asyncio
 from dotenv import load_dotenv
-from telethon import TelegramClient, events
-from models import SessionLocal, Token, TokenMention, Message, TargetChannel, init_db
-from parser import extract_ca, parse_rick_bot_response
-from analysis import get_wallet_profile
-from scoring import update_velocity, calculate_moonshot_score
 from datetime import datetime
+from telethon import TelegramClient, events, utils
+from sqlalchemy import select, update
+from models import SessionLocal, AsyncSessionLocal, async_engine, TargetChannel, init_db
+from velocity import warm_from_db
+from rick_dispatch import RickDispatcher
+from migrations import maintain, compact_mentions
+from rescoring import rescore_loop
+from leaderboard import leaderboard_loop
+from holders import start_profiler, stop_profiler
+from persistence import WriteBehindWriter
+from pipeline import Pipeline
+from workqueue import WorkConsumer, NotifyListener, shard_for, INGEST_SHARD
+import metrics
 
 load_dotenv()
 
@@ -18,8 +27,28 @@ RICK_BOT_ID = os.getenv('RICK_BOT_ID') or os.getenv('RICK_BOT')
 if RICK_BOT_ID and str(RICK_BOT_ID).isdigit():
     RICK_BOT_ID = int(RICK_BOT_ID)
 
-# Global list of channels to monitor
-MONITORED_CHANNELS = []
+# "all": this process also runs the analysis pipeline.
+# "ingest": only persist raw events to the work queue; processor.py workers analyse them.
+WORKER_MODE = os.getenv('WORKER_MODE', 'all')
+
+# Numeric peer ids of the channels to monitor. Replaced wholesale (never mutated)
+# so the handler can test membership with a single set lookup.
+MONITORED_CHAT_IDS = frozenset()
+
+# Fallback poll of target_channels; dashboard edits arrive immediately via NOTIFY
+CHANNEL_REFRESH_INTERVAL = int(os.getenv('CHANNEL_REFRESH_INTERVAL', '60'))
+CHANNEL_RESOLVE_CONCURRENCY = int(os.getenv('CHANNEL_RESOLVE_CONCURRENCY', '8'))
+COMPACTION_INTERVAL = int(os.getenv('COMPACTION_INTERVAL', '300'))
+CHANNELS_NOTIFY_CHANNEL = 'target_channels'
+
+# Numeric id of Rick Bot, resolved once at startup
+RICK_BOT_PEER_ID = None
+
+_events_seen = metrics.counter('handler_events_seen_total', 'Incoming messages evaluated by the event filter')
+_events_accepted = metrics.counter('handler_events_accepted_total', 'Incoming messages that passed the event filter')
+_filter_latency = metrics.histogram('handler_filter_seconds', 'Event filter evaluation time',
+                                    buckets=(1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3))
+_handler_latency = metrics.histogram('handler_seconds', 'Total handler time per accepted message')
 
 # Fix DATABASE_URL if it has double @ due to password
 DATABASE_URL = os.getenv('DATABASE_URL')
@@ -28,38 +57,143 @@ if DATABASE_URL and "@@" in DATABASE_URL:
     # Simple fix: replace the first @ in the user:pass@host part if we can identify it
     pass # Actually SQLAlchemy handles it better if we use %40 for the password @
 
-async def refresh_channels(client, db):
-    global MONITORED_CHANNELS
+async def resolve_channel(client, channel, semaphore):
+    """
+    Fetches the entity of a channel not resolved yet; returns its column updates or None.
+    """
+    val = channel.identifier
+    peer = int(val) if val.lstrip('-').isdigit() else val
+    async with semaphore:
+        try:
+            entity = await client.get_entity(peer)
+        except Exception as ex:
+            print(f"Could not resolve {val}: {ex}")
+            return None
+    return {
+        "id": channel.id,
+        "name": channel.name or getattr(entity, 'title', getattr(entity, 'first_name', 'Unknown')),
+        # The marked peer id that event.chat_id reports
+        "peer_id": utils.get_peer_id(entity),
+        "access_hash": getattr(entity, 'access_hash', None),
+        "resolved_at": datetime.utcnow(),
+    }
+
+def monitored_peer_id(channel, resolved):
+    if channel.id in resolved:
+        return resolved[channel.id]
+    if channel.peer_id is not None:
+        return channel.peer_id
+    # Numeric identifiers are usable even if the entity could not be fetched
+    val = channel.identifier
+    return utils.get_peer_id(int(val)) if val.lstrip('-').isdigit() else None
+
+async def refresh_channels(client):
+    global MONITORED_CHAT_IDS
+    listener = NotifyListener(CHANNELS_NOTIFY_CHANNEL)
+    semaphore = asyncio.Semaphore(CHANNEL_RESOLVE_CONCURRENCY)
     while True:
         try:
-            channels = db.query(TargetChannel).filter(TargetChannel.is_active == True).all()
-            new_list = []
-            for c in channels:
-                val = c.identifier
-                
-                # Auto-resolve name if missing
-                if not c.name:
-                    try:
-                        entity = await client.get_entity(int(val) if val.lstrip('-').isdigit() else val)
-                        c.name = getattr(entity, 'title', getattr(entity, 'first_name', 'Unknown'))
-                        db.commit()
-                        print(f"Resolved name for {val}: {c.name}")
-                    except Exception as ex:
-                        print(f"Could not resolve name for {val}: {ex}")
-
-                if val.lstrip('-').isdigit():
-                    new_list.append(int(val))
-                else:
-                    new_list.append(val)
-            
-            if set(new_list) != set(MONITORED_CHANNELS):
-                print(f"Update detected. Now monitoring {len(new_list)} channels.")
-                MONITORED_CHANNELS = new_list
+            async with AsyncSessionLocal() as db:
+                channels = (await db.scalars(select(TargetChannel).where(TargetChannel.is_active == True))).all()
+
+            # Only new channels hit Telegram, concurrently; cached ones are free
+            pending = [c for c in channels if c.peer_id is None or not c.name]
+            results = await asyncio.gather(*(resolve_channel(client, c, semaphore) for c in pending))
+            updates = [r for r in results if r]
+            if updates:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(update(TargetChannel), updates)
+                    await db.commit()
+                print(f"Resolved {len(updates)} channels: {', '.join(u['name'] for u in updates)}")
+
+            resolved = {u['id']: u['peer_id'] for u in updates}
+            new_ids = {monitored_peer_id(c, resolved) for c in channels} - {None}
+            if new_ids != MONITORED_CHAT_IDS:
+                print(f"Update detected. Now monitoring {len(new_ids)} channels.")
+                MONITORED_CHAT_IDS = frozenset(new_ids)
         except Exception as e:
             print(f"Error refreshing channels: {e}")
-        await asyncio.sleep(60)
+        await listener.wait(CHANNEL_REFRESH_INTERVAL)
+
+async def partition_maintenance(interval=6 * 3600):
+    """
+    Keeps daily partitions created ahead of time and drops expired ones.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(maintain)
+        except Exception as e:
+            print(f"Error during partition maintenance: {e}")
+        await asyncio.sleep(interval)
+
+async def mention_compaction(interval=COMPACTION_INTERVAL):
+    """
+    Rolls old token_mentions into minute/hour buckets (see migrations.compact_mentions).
+    """
+    while True:
+        try:
+            minute_rows, hour_rows = await asyncio.to_thread(compact_mentions)
+            if minute_rows or hour_rows:
+                print(f"Compacted mentions into {minute_rows} minute and {hour_rows} hourly buckets.")
+        except Exception as e:
+            print(f"Error during mention compaction: {e}")
+        await asyncio.sleep(interval)
+
+def is_relevant(event):
+    """
+    Event filter evaluated by Telethon before the handler is scheduled.
+    Only uses ids already present on the update, so it never triggers a fetch.
+    """
+    started = time.perf_counter()
+    # Rick Bot's answers to us arrive in its DM; elsewhere it is just another sender
+    relevant = event.chat_id in MONITORED_CHAT_IDS or event.chat_id == RICK_BOT_PEER_ID
+    _filter_latency.observe(time.perf_counter() - started)
+    _events_seen.inc()
+    if relevant:
+        _events_accepted.inc()
+    return relevant
+
+def message_links(message):
+    """
+    URLs hidden behind text links (MessageEntityTextUrl); plain URLs are already in the text.
+    """
+    return [url for url in (getattr(e, 'url', None) for e in (message.entities or ())) if url]
+
+def make_handler(writer, dispatcher, pipeline=None):
+    """
+    Builds the NewMessage handler. With a pipeline the message is analysed
+    in-process; without one it is only queued for the analysis workers.
+    """
+    async def global_handler(event):
+        text = event.message.message
+        if not text: return
+        with _handler_latency.time():
+            # Only Rick's DM answers our requests; in monitored groups it replies to other users
+            is_rick = event.chat_id == RICK_BOT_PEER_ID
+            reply_ca = dispatcher.match_reply(event.message) if is_rick else None
+            # Telethon dates are aware UTC; the tables store naive UTC
+            timestamp = event.message.date.replace(tzinfo=None)
+            # Rick links each top holder's wallet behind its percentage
+            links = message_links(event.message) if is_rick else []
+
+            if pipeline is None:
+                await writer.add_work('message', {
+                    "chat_id": str(event.chat_id),
+                    "sender_id": str(event.sender_id),
+                    "text": text,
+                    "is_rick": is_rick,
+                    "ca": reply_ca,
+                    "ts": timestamp.isoformat(),
+                    "links": links,
+                }, shard_for(reply_ca) if reply_ca else None)
+            else:
+                await pipeline.handle_message(event.chat_id, event.sender_id, text, is_rick, reply_ca, timestamp, links)
+
+    return global_handler
 
 async def main():
+    global RICK_BOT_PEER_ID
+
     # Initialize DB
     init_db()
     
@@ -68,93 +202,57 @@ async def main():
     await client.start(phone=PHONE)
     print("Professional Memecoin Analyzer Worker is running...")
 
-    db = SessionLocal()
-    
+    RICK_BOT_PEER_ID = await client.get_peer_id(RICK_BOT_ID)
+
+    ingest_only = WORKER_MODE == 'ingest'
+
+    # Batched write-behind persistence for the handlers
+    writer = WriteBehindWriter()
+    writer.start()
+
+    # Rick Bot dispatch queue
+    dispatcher = RickDispatcher(client, RICK_BOT_ID)
+    dispatcher.start()
+
     # Start background channel refresh
-    asyncio.create_task(refresh_channels(client, db))
+    asyncio.create_task(refresh_channels(client))
+    asyncio.create_task(partition_maintenance())
+    asyncio.create_task(mention_compaction())
 
-    @client.on(events.NewMessage())
-    async def global_handler(event):
-        # Only process if chat is in our monitored list
-        chat_id = event.chat_id
-        if chat_id not in MONITORED_CHANNELS and event.chat.username not in [str(c).replace('@', '') for c in MONITORED_CHANNELS if isinstance(c, str)]:
-            # Special case for Rick Bot response
-            if event.sender_id != RICK_BOT_ID:
-                return
+    # Prometheus endpoint plus a periodic structured log line
+    metrics.serve()
+    asyncio.create_task(metrics.log_loop())
 
-        text = event.message.message
-        if not text: return
+    pipeline = holders = None
+    if ingest_only:
+        # Audit requests produced by the analysis workers
+        async def handle_requests(items, db):
+            for item in items:
+                dispatcher.submit(item.payload['ca'], item.payload.get('score', 0))
+        asyncio.create_task(WorkConsumer([INGEST_SHARD], include_unsharded=False).run(handle_requests))
+    else:
+        # Seed the in-memory velocity counter from the durable mention log
+        with SessionLocal() as db:
+            warm_from_db(db)
+        asyncio.create_task(rescore_loop())
+        asyncio.create_task(leaderboard_loop())
+
+        async def dispatch(ca, score):
+            dispatcher.submit(ca, score)
+        holders = start_profiler(writer)
+        pipeline = Pipeline(writer, dispatch, holders=holders)
 
-        # 1. Save to raw messages feed
-        msg = Message(
-            channel_id=str(chat_id),
-            sender_id=str(event.sender_id),
-            text=text
-        )
-        db.add(msg)
-        db.commit()
-
-        # 2. Case: Message from monitored channels
-        if event.sender_id != RICK_BOT_ID:
-            ca, platform = extract_ca(text)
-            if ca:
-                print(f"Detected CA: {ca} on {platform}. Sending to Rick Bot...")
-                
-                # Log the mention
-                mention = TokenMention(contract_address=ca, source_channel=str(chat_id))
-                db.add(mention)
-                
-                # Update Velocity and Initial Score
-                token = db.query(Token).filter(Token.contract_address == ca).first()
-                if not token:
-                    token = Token(contract_address=ca, platform=platform)
-                    db.add(token)
-                
-                m5, m15, m1h = update_velocity(ca, db)
-                token.mentions_5m = m5
-                token.mentions_15m = m15
-                token.mentions_1h = m1h
-                
-                calculate_moonshot_score(token, db)
-                db.commit()
-
-                # Forward to Rick Bot
-                try:
-                    # Resolve entity first to ensure Telethon knows who it is
-                    rick_entity = await client.get_entity(RICK_BOT_ID)
-                    sent_msg = await client.send_message(rick_entity, ca)
-                    print(f"Successfully forwarded CA to Rick Bot (Msg ID: {sent_msg.id})")
-                except Exception as e:
-                    print(f"❌ FAILED to send to Rick Bot: {e}")
-
-        # 3. Case: Message from Rick Bot
-        else:
-            print("Received response from Rick Bot. Analyzing...")
-            parsed_data = parse_rick_bot_response(text)
-            
-            if 'contract_address' in parsed_data:
-                ca = parsed_data['contract_address']
-                token = db.query(Token).filter(Token.contract_address == ca).first()
-                if not token:
-                    token = Token(contract_address=ca)
-                    db.add(token)
-                
-                for key, value in parsed_data.items():
-                    setattr(token, key, value)
-                
-                token.raw_response = text # Save the full raw text
-                calculate_moonshot_score(token, db)
-                db.commit()
-                print(f"Updated token info and score for {ca}")
-
-            # 3. Trigger Wallet Analysis if Top Holders present in Rick's text (simulated here)
-            # In a real scenario, we might extract wallet addresses from the audit response
-            # holders = extract_wallets(text)
-            # for wallet in holders:
-            #     profile = await get_wallet_profile(wallet)
-            #     save_holder_profile(profile)
-
-    await client.run_until_disconnected()
+    # Only monitored chats and Rick Bot replies reach the handler
+    client.add_event_handler(make_handler(writer, dispatcher, pipeline),
+                             events.NewMessage(incoming=True, func=is_relevant))
+
+    try:
+        await client.run_until_disconnected()
+    finally:
+        await dispatcher.close()
+        await stop_profiler(holders)
+        await writer.close()
+        await async_engine.dispose()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,159 @@
+import os
+import zlib
+import asyncio
+from datetime import datetime
+import asyncpg
+from sqlalchemy import text, insert
+from models import AsyncSessionLocal, WorkItem, engine
+import metrics
+
+WORK_CHANNEL = 'work_items'
+# Items only the ingest process (which owns the Telegram client) may claim
+INGEST_SHARD = -1
+# CAs are spread over this many shards; every analysis worker must agree on it
+ANALYSIS_SHARD_COUNT = int(os.getenv('ANALYSIS_SHARD_COUNT', '1'))
+WORK_BATCH_SIZE = int(os.getenv('WORK_BATCH_SIZE', '200'))
+# Fallback poll in case a NOTIFY is missed (e.g. listener reconnect)
+WORK_POLL_SECONDS = float(os.getenv('WORK_POLL_SECONDS', '5'))
+
+_claimed = metrics.counter('work_items_claimed_total', 'Work items claimed from the queue')
+_claim_batch = metrics.histogram('work_claim_batch_size', 'Items per claimed batch',
+                                 buckets=(1, 5, 10, 25, 50, 100, 200, 500))
+_queue_lag = metrics.histogram('work_queue_lag_seconds', 'Time items spent in the work queue')
+
+# Claiming deletes the rows inside the caller's transaction: if processing fails
+# the transaction rolls back and the items become claimable again.
+_CLAIM_SQL = """
+    DELETE FROM bot_schema.work_items
+    WHERE id IN (
+        SELECT id FROM bot_schema.work_items
+        WHERE {where}
+        ORDER BY id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, kind, shard, payload, created_at
+"""
+CLAIM_SHARDED = text(_CLAIM_SQL.format(where="shard IS NULL OR shard = ANY(:shards)"))
+CLAIM_OWNED_ONLY = text(_CLAIM_SQL.format(where="shard = ANY(:shards)"))
+
+
+def shard_for(ca, shard_count=ANALYSIS_SHARD_COUNT):
+    """
+    Stable CA -> shard mapping, so one worker sees every mention of a CA.
+    """
+    return zlib.crc32(ca.encode()) % shard_count
+
+
+async def enqueue(items, session_factory=AsyncSessionLocal):
+    """
+    Inserts (kind, payload, shard) work items in one statement and commits.
+    """
+    now = datetime.utcnow()
+    rows = [{"kind": kind, "payload": payload, "shard": shard, "created_at": now} for kind, payload, shard in items]
+    if not rows:
+        return
+    async with session_factory() as db:
+        await db.execute(insert(WorkItem.__table__), rows)
+        await db.commit()
+
+
+def _dsn():
+    # asyncpg wants the plain libpq-style URL without the SQLAlchemy driver suffix
+    return engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+class NotifyListener:
+    """
+    Dedicated LISTEN connection; wait() returns when the channel is notified or on timeout.
+    """
+
+    def __init__(self, channel=WORK_CHANNEL):
+        self.channel = channel
+        self.conn = None
+        self._notified = asyncio.Event()
+
+    def _on_notify(self, *_args):
+        self._notified.set()
+
+    async def _connect(self):
+        self.conn = await asyncpg.connect(_dsn())
+        await self.conn.add_listener(self.channel, self._on_notify)
+
+    async def wait(self, timeout=WORK_POLL_SECONDS):
+        try:
+            if self.conn is None or self.conn.is_closed():
+                await asyncio.wait_for(self._connect(), timeout)
+            await asyncio.wait_for(self._notified.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except (OSError, asyncpg.PostgresError) as e:
+            print(f"LISTEN {self.channel} error: {e}")
+            self.conn = None
+            await asyncio.sleep(timeout)
+            return False
+        finally:
+            self._notified.clear()
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+
+class WorkConsumer:
+    """
+    Claims batches of work items with SELECT ... FOR UPDATE SKIP LOCKED, so any
+    number of consumers can share the table, and commits the claim only after
+    the batch handler returns.
+
+    handle_batch(items, db) gets the claiming session: whatever it writes there
+    commits or rolls back together with the claim. It may return a coroutine
+    function, awaited once that commit succeeded.
+    """
+
+    def __init__(self, shards, include_unsharded=True, batch_size=WORK_BATCH_SIZE,
+                 session_factory=AsyncSessionLocal):
+        self.shards = list(shards)
+        self.claim_sql = CLAIM_SHARDED if include_unsharded else CLAIM_OWNED_ONLY
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+
+    async def _claim(self, db):
+        result = await db.execute(self.claim_sql, {"shards": self.shards, "limit": self.batch_size})
+        return sorted(result.fetchall(), key=lambda r: r.id)
+
+    async def run(self, handle_batch):
+        """
+        Forever: claim a batch, await handle_batch(items, db), commit. Sleeps on LISTEN when idle.
+        """
+        listener = NotifyListener()
+        try:
+            while True:
+                items, committed = [], None
+                async with self.session_factory() as db:
+                    try:
+                        items = await self._claim(db)
+                        if items:
+                            _claimed.inc(len(items))
+                            _claim_batch.observe(len(items))
+                            now = datetime.utcnow()
+                            for item in items:
+                                if item.created_at:
+                                    _queue_lag.observe((now - item.created_at).total_seconds())
+                            committed = await handle_batch(items, db)
+                        await db.commit()
+                    except Exception as e:
+                        print(f"Error processing work batch ({len(items)} items), will retry: {e}")
+                        await db.rollback()
+                        items, committed = [], None
+                        await asyncio.sleep(1)
+                if committed is not None:
+                    try:
+                        await committed()
+                    except Exception as e:
+                        print(f"Error after committing work batch: {e}")
+                if len(items) < self.batch_size:
+                    await listener.wait()
+        finally:
+            await listener.close()